@@ -0,0 +1,508 @@
+import argparse
+import json
+import mmap
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import tkinter as tk
+
+import notepad
+import notepad_core
+
+
+def make_document(words, vocabulary, typo_rate=0.05, seed=1):
+    rng = random.Random(seed)
+    lines, line = [], []
+    for _ in range(words):
+        word = rng.choice(vocabulary)
+        if rng.random() < typo_rate:
+            word = word[:2] + 'qx' + word[2:]
+        line.append(word)
+        if len(line) >= 12:
+            lines.append(' '.join(line) + '.')
+            line = []
+    lines.append(' '.join(line))
+    return '\n'.join(lines)
+
+
+def seconds(value):
+    return '-' if value is None else f"{value:.3f}s"
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def make_root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+    return root
+
+
+def legacy_check_spelling(text_area, checker):
+    text = text_area.get(1.0, tk.END)
+    misspelled = checker.unknown(notepad.WORD_RE.findall(text))
+    for word in misspelled:
+        idx = '1.0'
+        while True:
+            idx = text_area.search(word, idx, nocase=1, stopindex=tk.END)
+            if not idx:
+                break
+            lastidx = f'{idx}+{len(word)}c'
+            text_area.tag_add('misspelled', idx, lastidx)
+            idx = lastidx
+
+
+def bench_spelling(args):
+    checker = notepad.get_spell_checker()
+    vocabulary = [w for w in list(checker.word_frequency.keys())[:20000] if w.isalpha()]
+    root = make_root()
+    text_area = None
+    if root is not None:
+        text_area = tk.Text(root)
+        notepad.TextEditHook(text_area)
+    else:
+        print("No display: timing tokenize/classify only (run under xvfb-run for tagging)")
+    
+    print(f"{'words':>8} {'engine':>10} {'us/word':>8} {'tagging':>10} {'legacy':>10}")
+    for words in args.sizes:
+        text = make_document(words, vocabulary)
+        engine_time, (spans, _) = timed(notepad.misspelled_spans, text, checker)
+        tag_time = legacy_time = None
+        if text_area is not None:
+            text_area.delete(1.0, tk.END)
+            text_area.insert(1.0, text)
+            tag_time, _ = timed(notepad.tag_spans, text_area, 'misspelled', spans)
+            if args.legacy:
+                text_area.tag_remove('misspelled', 1.0, tk.END)
+                legacy_time, _ = timed(legacy_check_spelling, text_area, checker)
+        print(f"{words:>8} {seconds(engine_time):>10} {engine_time / words * 1e6:>8.2f} "
+              f"{seconds(tag_time):>10} {seconds(legacy_time):>10}")
+    if root is not None:
+        root.destroy()
+
+
+def make_text(megabytes, vocabulary):
+    block = make_document(20000, vocabulary, typo_rate=0) + '\n'
+    size = int(megabytes * 1024 * 1024)
+    return (block * (size // len(block) + 1))[:size]
+
+
+def save_legacy(text_area, path):
+    notepad.atomic_write(path, text_area.get(1.0, tk.END)[:-1])
+
+
+def bench_document(args):
+    # PieceTable reads against the whole-buffer text_area.get() they replace
+    vocabulary = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit',
+                  'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore']
+    rng = random.Random(1)
+    root = make_root()
+    if root is None:
+        print("No display: timing the document model only (run under xvfb-run for the widget columns)")
+    path = os.path.join(tempfile.mkdtemp(), 'bench.txt')
+    
+    print(f"{'MB':>6} {'load':>8} {'text()':>8} {'get()':>8} {'lines':>8} {'get lines':>9} "
+          f"{'typing':>8} {'save':>8} {'save get':>8}")
+    for megabytes in args.megabytes:
+        text = make_text(megabytes, vocabulary)
+        
+        # Fed the way FileLoader fills the widget: chunk by chunk at the end
+        document = notepad.PieceTable()
+        
+        def load():
+            for i in range(0, len(text), notepad.LOAD_CHUNK_SIZE):
+                document.insert(len(document), text[i:i + notepad.LOAD_CHUNK_SIZE])
+        load_time, _ = timed(load)
+        text_time, _ = timed(document.text)
+        
+        lines = [rng.randint(1, document.line_count) for _ in range(1000)]
+        lines_time, _ = timed(lambda: [document.line(line) for line in lines])
+        offsets = [rng.randint(0, len(document)) for _ in range(1000)]
+        typing_time, _ = timed(lambda: [document.insert(offset, 'x') for offset in offsets])
+        save_time, _ = timed(notepad.atomic_write, path, document)
+        
+        get_time = get_lines_time = save_get_time = None
+        if root is not None:
+            text_area = tk.Text(root)
+            text_area.insert(1.0, text)
+            get_time, _ = timed(text_area.get, 1.0, tk.END)
+            get_lines_time, _ = timed(lambda: [text_area.get(f'{line}.0', f'{line}.end') for line in lines])
+            save_get_time, _ = timed(save_legacy, text_area, path)
+            text_area.destroy()
+        
+        print(f"{megabytes:>6g} {seconds(load_time):>8} {seconds(text_time):>8} {seconds(get_time):>8} "
+              f"{seconds(lines_time):>8} {seconds(get_lines_time):>9} {seconds(typing_time):>8} "
+              f"{seconds(save_time):>8} {seconds(save_get_time):>8}")
+    os.remove(path)
+    if root is not None:
+        root.destroy()
+
+
+def bench_batch(args):
+    # Files per second of the batch command line at each worker count
+    checker = notepad.get_spell_checker()
+    vocabulary = [w for w in list(checker.word_frequency.keys())[:20000] if w.isalpha()]
+    folder = tempfile.mkdtemp()
+    paths = []
+    for i in range(args.files):
+        path = os.path.join(folder, f'doc{i}.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(make_document(args.words, vocabulary, seed=i))
+        paths.append(path)
+    
+    print(f"{args.files} files of {args.words} words, {os.cpu_count()} CPUs")
+    print(f"{'jobs':>6} {'time':>8} {'files/s':>9} {'speedup':>8}")
+    base = None
+    for jobs in args.jobs:
+        elapsed, reports = timed(lambda: list(notepad_core.run_batch(paths, jobs=jobs)))
+        base = base or elapsed
+        print(f"{jobs:>6} {seconds(elapsed):>8} {len(reports) / elapsed:>9.1f} {base / elapsed:>7.2f}x")
+    for path in paths:
+        os.remove(path)
+    os.rmdir(folder)
+
+
+# Regression suite: each case takes (path, text, root), sets up untimed and
+# returns the hot path as a callable, or None where the case does not apply
+# (no display for widget cases; files the editor opens read-only). SUITE
+# says how many operations one call runs, so keystrokes are timed per key.
+LOREM = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit',
+         'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore']
+
+
+def is_large(text):
+    return len(text) >= notepad.LARGE_FILE_THRESHOLD
+
+
+def make_editor(root, text=''):
+    # A text widget wired up the way EnhancedNotepadPro.materialize does it
+    text_area = tk.Text(root)
+    hook = notepad.TextEditHook(text_area)
+    document = notepad.PieceTable()
+    hook.listeners.append(document.on_change)
+    stats = notepad.TextStats(hook)
+    notepad.FindEngine(hook)
+    text_area.insert('1.0', text)
+    return text_area, stats, document
+
+
+class DocumentHook:
+    # Just enough of TextEditHook for FindEngine to search a PieceTable
+    # without a widget: 'get' reads the document and tags are dropped
+    def __init__(self, document):
+        self.document = document
+        self.listeners = []
+        self.widget = self
+    
+    def call(self, op, start, end):
+        assert (op, start, end) == ('get', '1.0', 'end-1c')
+        return self.document.text()
+    
+    def index(self, index):
+        return '1.0'
+    
+    def tag_add(self, *args):
+        pass
+    
+    def tag_remove(self, *args):
+        pass
+
+
+def make_piece_table(text):
+    document = notepad.PieceTable()
+    for i in range(0, len(text), notepad.LOAD_CHUNK_SIZE):
+        document.insert(len(document), text[i:i + notepad.LOAD_CHUNK_SIZE])
+    return document
+
+
+def case_open(path, text, root):
+    # Small files stream into a Text widget as poll_loader does; large ones
+    # only build the line index behind the mmap view
+    def open_large():
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        index = notepad.LineIndex(mm)
+        index.thread.join()
+        mm.close()
+    
+    def open_small():
+        loader = notepad.FileLoader(path, notepad.detect_encoding(path))
+        loader.start()
+        for chunk in iter(loader.chunks.get, None):
+            text_area.insert(tk.END, chunk)
+    
+    if is_large(text):
+        return open_large
+    if root is None:
+        return None
+    text_area, stats, document = make_editor(root)
+    return open_small
+
+
+def case_save(path, text, root):
+    if is_large(text):
+        return None
+    document = make_piece_table(text)
+    return lambda: notepad.atomic_write(path + '.saved', document)
+
+
+def case_find(path, text, root):
+    if is_large(text):
+        return None
+    engine = notepad.FindEngine(DocumentHook(make_piece_table(text)))
+    return lambda: engine.set_pattern('lorem', whole_word=True)
+
+
+def case_spelling(path, text, root):
+    if is_large(text):
+        return None
+    document = make_piece_table(text)
+    checker = notepad.get_spell_checker()
+    return lambda: notepad.misspelled_spans(document.text(), checker)
+
+
+KEYSTROKES = 200
+
+
+def case_keystroke(path, text, root):
+    # Insert one character, then bring the status bar up to date the way the
+    # editor does, flushing its StatusScheduler at once instead of per frame
+    if root is None or is_large(text):
+        return None
+    text_area, stats, document = make_editor(root, text)
+    status = notepad.StatusScheduler(root)
+    status.add('status', tk.Label(root), lambda: notepad.format_status(text_area, stats))
+    rng = random.Random(1)
+    offsets = [rng.randint(0, len(text)) for _ in range(KEYSTROKES)]
+    
+    def type_keys():
+        for offset in offsets:
+            text_area.mark_set(tk.INSERT, f'1.0+{offset}c')
+            text_area.insert(tk.INSERT, 'x')
+            status.mark('status')
+            status.flush()
+    return type_keys
+
+
+def case_replace(path, text, root):
+    if root is None or is_large(text):
+        return None
+    text_area, stats, document = make_editor(root, text)
+    pattern = notepad.compile_search('lorem', whole_word=True)
+    return lambda: notepad.replace_all(text_area, document.text(), pattern, 'LOREM')
+
+
+SUITE = {
+    'open': (case_open, 1),
+    'save': (case_save, 1),
+    'find': (case_find, 1),
+    'spelling': (case_spelling, 1),
+    'keystroke': (case_keystroke, KEYSTROKES),
+    'replace': (case_replace, 1),
+}
+
+
+def destroy_widgets(root):
+    if root is not None:
+        for child in root.winfo_children():
+            child.destroy()
+
+
+def measure(case, operations, path, text, root, repeat):
+    # Best time of repeat fresh runs, then peak Python memory of one more
+    # run under tracemalloc, which slows allocation too much to time with
+    best = None
+    for _ in range(repeat):
+        run = case(path, text, root)
+        if run is None:
+            return None
+        start = time.perf_counter()
+        run()
+        elapsed = (time.perf_counter() - start) / operations
+        best = elapsed if best is None else min(best, elapsed)
+        destroy_widgets(root)
+    run = case(path, text, root)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        destroy_widgets(root)
+    return {'seconds': best, 'peak_mb': peak / (1024 * 1024)}
+
+
+def find_regressions(results, baseline, tolerance, min_seconds, min_mb=1.0):
+    # Slower or bigger than the baseline by more than tolerance, ignoring
+    # differences too small to be more than timer and allocator noise
+    regressions = []
+    for key, current in sorted(results.items()):
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        for metric, floor in (('seconds', min_seconds), ('peak_mb', min_mb)):
+            old, new = previous.get(metric), current.get(metric)
+            if old is not None and new > old * (1 + tolerance) and new - old > floor:
+                regressions.append(f"{key} {metric}: {old:.4g} -> {new:.4g} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def bench_suite(args):
+    root = make_root()
+    if root is None:
+        print("No display: skipping the widget cases (run under xvfb-run for open/keystroke/replace)")
+    folder = tempfile.mkdtemp()
+    results = {}
+    
+    print(f"{'KB':>8} " + " ".join(f"{name:>17}" for name in SUITE))
+    for kilobytes in args.kilobytes:
+        text = make_text(kilobytes / 1024, LOREM)
+        path = os.path.join(folder, f'{kilobytes}kb.txt')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        cells = []
+        for name, (case, operations) in SUITE.items():
+            result = measure(case, operations, path, text, root, args.repeat)
+            if result is None:
+                cells.append('-')
+                continue
+            results[f'{name}/{kilobytes}KB'] = result
+            unit = 'ms/op' if operations > 1 else 'ms'
+            cells.append(f"{result['seconds'] * 1000:.1f}{unit} {result['peak_mb']:.0f}MB")
+        print(f"{kilobytes:>8} " + " ".join(f"{cell:>17}" for cell in cells))
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+    os.rmdir(folder)
+    if root is not None:
+        root.destroy()
+    
+    status = 0
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline['results'], args.tolerance, args.min_delta)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} of {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            status = 1
+        else:
+            print(f"\nNo regressions beyond {args.tolerance:.0%} of {args.baseline}")
+    if args.save_baseline:
+        baseline = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'display': root is not None,
+            'results': results,
+        }
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    return status
+
+
+# A full launch: window, warm spell checker, and the file loaded
+COLD_START = '''
+import sys, time, tkinter as tk, notepad
+root = tk.Tk()
+app = notepad.EnhancedNotepadPro(root)
+app.open_paths(sys.argv[1:])
+while not notepad.engines_warm.is_set() or app.tab.loader:
+    root.update()
+    time.sleep(0.001)
+app.shutdown()
+'''
+
+
+def bench_instance(args):
+    root = make_root()
+    if root is None:
+        print("No display: the instance benchmark starts editors (run under xvfb-run)")
+        return
+    root.destroy()
+    # Settings, data and the instance socket go to a scratch directory
+    folder = tempfile.mkdtemp()
+    env = dict(os.environ, XDG_RUNTIME_DIR=folder, XDG_CONFIG_HOME=folder, XDG_DATA_HOME=folder)
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(here, 'notepad.py')
+    path = os.path.join(folder, 'doc.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(make_text(0.1, LOREM))
+    
+    def best(command):
+        times = []
+        for _ in range(args.repeat):
+            elapsed, result = timed(lambda: subprocess.run(command, env=env, cwd=here, timeout=120))
+            result.check_returncode()
+            times.append(elapsed)
+        return min(times)
+    
+    interpreter = best([sys.executable, '-c', 'pass'])
+    cold = best([sys.executable, '-c', COLD_START, path])
+    server = subprocess.Popen([sys.executable, script], env=env, cwd=here)
+    try:
+        socket_path = notepad.instance_socket_path(folder)
+        deadline = time.perf_counter() + 60
+        while not os.path.exists(socket_path) and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        warm = best([sys.executable, script, path])
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(folder, ignore_errors=True)
+    print(f"{'interpreter start':<20} {seconds(interpreter):>8}")
+    print(f"{'cold start':<20} {seconds(cold):>8}")
+    print(f"{'warm handoff':<20} {seconds(warm):>8}  ({cold / warm:.0f}x faster than a cold start)")
+
+
+BENCHMARKS = {
+    'spelling': bench_spelling,
+    'document': bench_document,
+    'batch': bench_batch,
+    'suite': bench_suite,
+    'instance': bench_instance,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enhanced Notepad Pro benchmarks")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[12500, 25000, 50000, 100000],
+                        help="document sizes in words")
+    parser.add_argument('--megabytes', type=float, nargs='+', default=[1, 10, 100],
+                        help="document sizes for the document benchmark")
+    parser.add_argument('--files', type=int, default=500, help="file count for the batch benchmark")
+    parser.add_argument('--words', type=int, default=2000, help="words per file for the batch benchmark")
+    parser.add_argument('--jobs', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}),
+                        help="worker counts for the batch benchmark")
+    parser.add_argument('--kilobytes', type=int, nargs='+', default=[10, 100, 1024, 10240, 102400],
+                        help="document sizes for the suite")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="suite and instance runs per case; the best is kept")
+    parser.add_argument('--baseline', help="suite results to compare against; exits 1 on a regression")
+    parser.add_argument('--save-baseline', help="write the suite results to this file")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown or memory growth over the baseline (0.25 = 25%%)")
+    parser.add_argument('--min-delta', type=float, default=0.005,
+                        help="time differences below this many seconds are never regressions")
+    parser.add_argument('--legacy', action='store_true',
+                        help="also time the previous per-word search loop (quadratic)")
+    args = parser.parse_args()
+    sys.exit(BENCHMARKS[args.benchmark](args))
+
+
+if __name__ == "__main__":
+    main()
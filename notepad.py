@@ -1,59 +1,2553 @@
+import time
+STARTUP_T0 = time.perf_counter()
+
+import json
+import os
+import socket
+import sys
+
+
+def instance_socket_path(base=None):
+    # One running editor per user. The socket lives in a directory only the
+    # user can enter, so nobody else can listen there or connect to it; a
+    # directory someone else created or opened up is refused (OSError).
+    base = base or os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+    directory = os.path.join(base, f'EnhancedNotepadPro-{os.getuid()}')
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if os.path.islink(directory) or not os.path.isdir(directory) or info.st_uid != os.getuid() \
+            or info.st_mode & 0o077:
+        raise OSError(f"{directory} is not a private directory")
+    return os.path.join(directory, 'instance.sock')
+
+
+def hand_off(argv, timeout=2.0):
+    # Runs before the imports below: if an editor is already listening, send
+    # it the files and let this process exit. Any option means this launch
+    # wants a process of its own.
+    if not hasattr(socket, 'AF_UNIX') or any(arg.startswith('-') for arg in argv):
+        return False
+    message = json.dumps({'files': [os.path.abspath(arg) for arg in argv]}).encode('utf-8') + b'\n'
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(instance_socket_path())
+            client.sendall(message)
+            return client.recv(16).startswith(b'ok')
+    except OSError:
+        return False
+
+
+if __name__ == "__main__" and hand_off(sys.argv[1:]):
+    sys.exit(0)
+
 import tkinter as tk
-from tkinter import messagebox, filedialog, font as tkfont, colorchooser, simpledialog
-from spellchecker import SpellChecker
-import pyttsx3
+from tkinter import ttk, messagebox, filedialog, font as tkfont, colorchooser, simpledialog
 import re
+from collections import deque, namedtuple
 from datetime import datetime
-import json
-import os
+import abc
+import argparse
+import bisect
+import codecs
+import cProfile
+import functools
+import glob
+import hashlib
+import itertools
+import mmap
+import queue
+import shutil
+import tempfile
+import threading
+
+from notepad_core import (get_spell_checker, WORD_RE, NEWLINE_RE, SENTENCE_RE, LRUCache, GrammarChecker,
+                          detect_encoding, iter_matches, iter_words, misspelled_spans,
+                          SearchIndex, expand_paths, line_previews, lexer_for)
+
+
+class StartupProfiler:
+    # Records how long each launch step took; printed with --profile-startup
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.marks = []
+    
+    def mark(self, label):
+        now = time.perf_counter()
+        self.marks.append((label, now - self.last, now - self.start))
+        self.last = now
+    
+    def report(self, file=None):
+        file = file or sys.stderr
+        print("Startup timing:", file=file)
+        for label, step, total in self.marks:
+            print(f"  {label:<32} {step * 1000:8.1f} ms   (t={total * 1000:.1f} ms)", file=file)
+
+
+class HandlerProfiler:
+    # Opt-in (--instrument) timing of event handlers. instrument() replaces
+    # an object's public methods with timed wrappers, so Tk bindings, menu
+    # commands and after() callbacks made afterwards go through them. A
+    # heartbeat scheduled every interval ms measures how late the event loop
+    # runs it: that delay is time the UI could not respond.
+    def __init__(self, samples=5000, interval=50):
+        self.samples = samples
+        self.interval = interval
+        self.durations = {}
+        self.calls = {}
+        self.stalls = deque(maxlen=samples)
+        self.root = None
+        self.expected = None
+        self.cprofile = None
+        self.depth = 0
+        self.counters = {}
+    
+    def instrument(self, obj, prefix):
+        for name in dir(type(obj)):
+            value = getattr(type(obj), name)
+            if not name.startswith('_') and callable(value) and not isinstance(value, type):
+                setattr(obj, name, self.wrap(f'{prefix}.{name}', getattr(obj, name)))
+    
+    def wrap(self, name, func):
+        durations = self.durations.setdefault(name, deque(maxlen=self.samples))
+        self.calls.setdefault(name, 0)
+        
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            profile = self.cprofile if self.depth == 0 else None
+            self.depth += 1
+            if profile:
+                profile.enable()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                durations.append(time.perf_counter() - start)
+                self.calls[name] += 1
+                if profile:
+                    profile.disable()
+                self.depth -= 1
+        return timed
+    
+    def start_heartbeat(self, root):
+        self.root = root
+        self.expected = time.perf_counter() + self.interval / 1000
+        root.after(self.interval, self.beat)
+    
+    def beat(self):
+        now = time.perf_counter()
+        self.stalls.append(max(0.0, now - self.expected))
+        self.expected = now + self.interval / 1000
+        self.root.after(self.interval, self.beat)
+    
+    @staticmethod
+    def percentile(values, fraction):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+    
+    def summary(self):
+        # Handlers that ran, slowest p99 first; times in milliseconds
+        rows = [{'handler': name, 'calls': self.calls[name],
+                 'p50_ms': self.percentile(durations, 0.5) * 1000,
+                 'p99_ms': self.percentile(durations, 0.99) * 1000,
+                 'max_ms': max(durations) * 1000}
+                for name, durations in self.durations.items() if durations]
+        rows.sort(key=lambda row: -row['p99_ms'])
+        stalls = {'beats': len(self.stalls),
+                  'p50_ms': self.percentile(self.stalls, 0.5) * 1000,
+                  'p99_ms': self.percentile(self.stalls, 0.99) * 1000,
+                  'max_ms': max(self.stalls, default=0.0) * 1000,
+                  'over_100ms': sum(stall > 0.1 for stall in self.stalls)}
+        return rows, stalls
+    
+    def export_json(self, file_path):
+        rows, stalls = self.summary()
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump({'handlers': rows, 'stalls': stalls, 'heartbeat_ms': self.interval,
+                       'counters': {name: counts() for name, counts in self.counters.items()}}, f, indent=2)
+    
+    def record_cprofile(self, enabled=True):
+        if enabled and self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+        elif not enabled:
+            self.cprofile = None
+    
+    def dump_cprofile(self, file_path):
+        self.cprofile.dump_stats(file_path)
+
+
+startup = StartupProfiler(STARTUP_T0)
+startup.mark("import modules")
+engines_warm = threading.Event()
+
+# Text-to-speech is created on first use: starting the speech driver takes
+# seconds at launch. The spell checker is loaded the same way, in notepad_core.
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_speech_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                import pyttsx3
+                _engine = pyttsx3.init()
+    return _engine
+
+def user_data_dir():
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or os.path.expanduser('~/.local/share')
+    return os.path.join(base, 'EnhancedNotepadPro')
+
+
+def user_config_dir():
+    if sys.platform == 'win32':
+        base = os.environ.get('APPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+    return os.path.join(base, 'EnhancedNotepadPro')
+
+
+class WriteStats:
+    # Filled in by atomic_write as it goes: characters in, bytes out, and the
+    # time spent encoding versus writing and syncing
+    def __init__(self):
+        self.chars = 0
+        self.bytes = 0
+        self.encode_time = 0.0
+        self.write_time = 0.0
+        self.elapsed = 0.0
+    
+    def report(self):
+        megabytes = self.bytes / (1024 * 1024)
+        rate = megabytes / self.elapsed if self.elapsed else 0.0
+        writing = self.write_time * 100 / self.elapsed if self.elapsed else 0.0
+        return f"{megabytes:,.1f} MB in {self.elapsed:.2f} s ({rate:,.0f} MB/s, {writing:.0f}% in write/fsync)"
+
+
+def atomic_write(file_path, text, encoding='utf-8', newline=os.linesep, stats=None):
+    # Write to a temp file in the same directory, fsync, then os.replace, so
+    # a crash or full disk never leaves a truncated file behind. text may be
+    # a PieceTable, which is streamed piece by piece; either way it is
+    # encoded SAVE_CHUNK_SIZE characters at a time, with '\n' written as
+    # newline, so no full copy of the buffer is made.
+    started = time.perf_counter()
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(file_path)}.', suffix='.tmp')
+    encoder = codecs.getincrementalencoder(encoding)()
+    stats = stats or WriteStats()
+    try:
+        with os.fdopen(fd, 'wb', buffering=SAVE_CHUNK_SIZE) as file:
+            for chunk in text_chunks(text):
+                for i in range(0, len(chunk), SAVE_CHUNK_SIZE):
+                    part = chunk[i:i + SAVE_CHUNK_SIZE]
+                    start = time.perf_counter()
+                    data = encoder.encode(part if newline == '\n' else part.replace('\n', newline))
+                    encoded = time.perf_counter()
+                    file.write(data)
+                    stats.encode_time += encoded - start
+                    stats.write_time += time.perf_counter() - encoded
+                    stats.chars += len(part)
+                    stats.bytes += len(data)
+            start = time.perf_counter()
+            file.write(encoder.encode('', final=True))
+            file.flush()
+            os.fsync(file.fileno())
+            stats.write_time += time.perf_counter() - start
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+        stats.elapsed = time.perf_counter() - started
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def process_alive(pid):
+    if os.name == 'nt':
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# One edit as seen by the Text widget: indices are resolved before the edit,
+# lines first..old_last were replaced by lines first..new_last.
+TextChange = namedtuple('TextChange', 'op start end text first_line old_last new_last')
+
+
+def shift_lines(lines, change):
+    # A set of line numbers renumbered for change; the replaced lines drop out
+    delta = change.new_last - change.old_last
+    return {line + delta if line > change.old_last else line
+            for line in lines if not change.first_line <= line <= change.old_last}
+
+
+class TextEditHook:
+    # Routes the Text widget's Tcl command through Python so listeners see
+    # every insert/delete (typing, paste, undo/redo) as it happens.
+    def __init__(self, widget):
+        self.widget = widget
+        self.tk = widget.tk
+        self.listeners = []
+        self.orig = widget._w + '_orig'
+        self.pycmd = widget._w + '_hook'
+        self.tk.call('rename', widget._w, self.orig)
+        self.tk.createcommand(self.pycmd, self.dispatch)
+        # The proc turns (code, result) back into a real Tcl error so callers
+        # relying on TclError (e.g. no selection) behave as before.
+        self.tk.eval('proc %s args {set r [%s {*}$args]; return -code [lindex $r 0] [lindex $r 1]}'
+                     % (widget._w, self.pycmd))
+        widget.bind('<Destroy>', self.close, add='+')
+    
+    def call(self, *args):
+        return self.tk.call(self.orig, *args)
+    
+    def close(self, event=None):
+        if event is not None and event.widget is not self.widget:
+            return
+        try:
+            self.tk.deletecommand(self.pycmd)
+            self.tk.call('rename', self.widget._w, '')
+        except tk.TclError:
+            pass
+    
+    def dispatch(self, *args):
+        try:
+            if args and args[0] in ('insert', 'delete', 'replace') and self.listeners:
+                return (0, self.edit(*args))
+            return (0, self.call(*args))
+        except tk.TclError as e:
+            return (1, str(e))
+    
+    def line_of(self, index):
+        return int(str(index).split('.')[0])
+    
+    def edit(self, op, *args):
+        if str(self.call('cget', '-state')) == tk.DISABLED:
+            return self.call(op, *args)
+        if op == 'delete' and len(args) > 2:
+            # Several ranges: apply them back to front so indices stay valid
+            ranges = [(self.call('index', a), self.call('index', b)) for a, b in zip(args[::2], args[1::2])]
+            if len(args) % 2:
+                ranges.append((self.call('index', args[-1]), self.call('index', f'{args[-1]}+1c')))
+            ranges.sort(key=lambda r: tuple(map(int, str(r[0]).split('.'))), reverse=True)
+            for start, end in ranges:
+                self.edit('delete', start, end)
+            return ''
+        
+        last = self.call('index', 'end-1c')
+        start = self.call('index', args[0])
+        if self.tk.getboolean(self.call('compare', start, '>', last)):
+            start = last
+        if op == 'insert':
+            end = start
+            text = ''.join(args[1::2])
+        else:
+            end = self.call('index', args[1] if len(args) > 1 else f'{start}+1c')
+            if self.tk.getboolean(self.call('compare', end, '>', last)):
+                end = last
+            text = ''.join(args[2::2])
+            if op == 'delete' and not self.tk.getboolean(self.call('compare', end, '>', start)):
+                # Tk deletes nothing from an empty or reversed range
+                return self.call(op, *args)
+        
+        lines_before = self.line_of(self.call('index', tk.END))
+        result = self.call(op, *args)
+        lines_after = self.line_of(self.call('index', tk.END))
+        
+        first, old_last = self.line_of(start), self.line_of(end)
+        change = TextChange(op, str(start), str(end), text, first, old_last,
+                            old_last + lines_after - lines_before)
+        for listener in list(self.listeners):
+            try:
+                listener(change)
+            except Exception:
+                self.widget._report_exception()
+        return result
+
+
+class TextStats:
+    # Per-line word/char counts kept in step with the widget, so totals are
+    # updated from the touched lines only instead of re-scanning the buffer.
+    def __init__(self, hook):
+        self.hook = hook
+        self.line_words = [0]
+        self.line_chars = [0]
+        self.words = 0
+        self.line_total_chars = 0
+        hook.listeners.append(self.on_change)
+    
+    @property
+    def lines(self):
+        return len(self.line_words)
+    
+    @property
+    def chars(self):
+        # newlines between lines count as characters, like len(get(1.0, END)) - 1
+        return self.line_total_chars + self.lines - 1
+    
+    def on_change(self, change):
+        text = self.hook.call('get', f'{change.first_line}.0', f'{change.new_last}.end')
+        self.update_lines(change.first_line, change.old_last, str(text).split('\n'))
+    
+    def update_lines(self, first, old_last, lines):
+        i, j = first - 1, old_last
+        new_words = [len(WORD_RE.findall(line)) for line in lines]
+        new_chars = [len(line) for line in lines]
+        self.words += sum(new_words) - sum(self.line_words[i:j])
+        self.line_total_chars += sum(new_chars) - sum(self.line_chars[i:j])
+        self.line_words[i:j] = new_words
+        self.line_chars[i:j] = new_chars
+
+
+PIECE_SIZE = 64 * 1024
+
+
+class PieceTable:
+    # Python-side copy of a Text widget's contents, kept in step by the edit
+    # hook. The document is a list of pieces (string, start, end, newlines),
+    # each a slice of the loaded text or of an inserted string, so edits
+    # split pieces rather than copying text. Piece offsets and line counts
+    # are indexed lazily from the first piece an edit touched onwards.
+    def __init__(self, text=''):
+        self.pieces = self.make_pieces(text)
+        self.length = len(text)
+        self.newlines = text.count('\n')
+        self.starts = []
+        self.lines = []
+        self.valid = 0
+        self.newline_cache = LRUCache(256)
+    
+    @staticmethod
+    def make_pieces(text):
+        # Long text is cut up so finding a line inside a piece stays cheap
+        return [(text, i, min(i + PIECE_SIZE, len(text)), text.count('\n', i, i + PIECE_SIZE))
+                for i in range(0, len(text), PIECE_SIZE)]
+    
+    def __len__(self):
+        return self.length
+    
+    @property
+    def line_count(self):
+        return self.newlines + 1
+    
+    def copy(self):
+        # Pieces are immutable, so a copy is as cheap as the piece list
+        document = PieceTable()
+        document.pieces = list(self.pieces)
+        document.length = self.length
+        document.newlines = self.newlines
+        return document
+    
+    def reindex(self):
+        if self.valid == len(self.pieces) == len(self.starts):
+            return
+        del self.starts[self.valid:]
+        del self.lines[self.valid:]
+        offset = newlines = 0
+        if self.valid:
+            buf, start, end, count = self.pieces[self.valid - 1]
+            offset = self.starts[-1] + end - start
+            newlines = self.lines[-1] + count
+        for buf, start, end, count in self.pieces[self.valid:]:
+            self.starts.append(offset)
+            self.lines.append(newlines)
+            offset += end - start
+            newlines += count
+        self.valid = len(self.pieces)
+    
+    def locate(self, offset):
+        # (piece number, offset inside it); the end of the text is past the last piece
+        if offset >= self.length:
+            return len(self.pieces), 0
+        self.reindex()
+        i = bisect.bisect_right(self.starts, offset) - 1
+        return i, offset - self.starts[i]
+    
+    def split(self, offset):
+        # Number of the piece that starts at offset, splitting one if needed
+        i, rel = self.locate(offset)
+        if rel:
+            buf, start, end, count = self.pieces[i]
+            cut = start + rel
+            left = buf.count('\n', start, cut)
+            self.pieces[i:i + 1] = [(buf, start, cut, left), (buf, cut, end, count - left)]
+            self.valid = min(self.valid, i + 1)
+            i += 1
+        return i
+    
+    def insert(self, offset, text):
+        if not text:
+            return
+        i = self.split(min(offset, self.length))
+        previous = self.pieces[i - 1] if i else None
+        if previous and previous[1] == 0 and previous[2] == len(previous[0]) \
+                and previous[2] + len(text) <= PIECE_SIZE // 16:
+            # Typing: grow the small piece the last insert created
+            buf = previous[0] + text
+            self.pieces[i - 1] = (buf, 0, len(buf), previous[3] + text.count('\n'))
+            self.valid = min(self.valid, i)
+        else:
+            self.pieces[i:i] = self.make_pieces(text)
+            self.valid = min(self.valid, i)
+        self.length += len(text)
+        self.newlines += text.count('\n')
+        self.compact_if_needed()
+    
+    def delete(self, start, end):
+        end = min(end, self.length)
+        if start >= end:
+            return
+        i = self.split(start)
+        j = self.split(end)
+        removed = self.pieces[i:j]
+        del self.pieces[i:j]
+        self.valid = min(self.valid, i)
+        self.length -= end - start
+        self.newlines -= sum(piece[3] for piece in removed)
+        self.compact_if_needed()
+    
+    def compact_if_needed(self):
+        if len(self.pieces) > 1024 + self.length // (PIECE_SIZE // 4):
+            self.compact()
+    
+    def compact(self):
+        # Join runs of small pieces left behind by many scattered edits
+        pieces, run, size = [], [], 0
+        for piece in self.pieces:
+            small = piece[2] - piece[1] < PIECE_SIZE // 2
+            if small:
+                run.append(piece[0][piece[1]:piece[2]])
+                size += piece[2] - piece[1]
+                if size < PIECE_SIZE:
+                    continue
+            if run:
+                pieces.extend(self.make_pieces(''.join(run)))
+                run, size = [], 0
+            if not small:
+                pieces.append(piece)
+        if run:
+            pieces.extend(self.make_pieces(''.join(run)))
+        self.pieces = pieces
+        self.valid = 0
+    
+    def line_offset(self, line):
+        # Offset of the start of a 1-based line
+        if line <= 1:
+            return 0
+        if line > self.line_count:
+            return self.length
+        self.reindex()
+        k = line - 1
+        i = bisect.bisect_left(self.lines, k) - 1
+        piece = self.pieces[i]
+        return self.starts[i] + self.newline_positions(piece)[k - self.lines[i] - 1] + 1 - piece[1]
+    
+    def newline_positions(self, piece):
+        positions = self.newline_cache.get(piece)
+        if positions is None:
+            buf, start, end, count = piece
+            positions = [match.start() for match in NEWLINE_RE.finditer(buf, start, end)]
+            self.newline_cache.put(piece, positions)
+        return positions
+    
+    def offset(self, index):
+        # Offset of a normalized Tk 'line.col' index
+        line, col = map(int, str(index).split('.'))
+        return min(self.line_offset(line) + col, self.length)
+    
+    def index(self, offset):
+        offset = min(offset, self.length)
+        i, rel = self.locate(offset)
+        if i == len(self.pieces):
+            line = self.newlines + 1
+        else:
+            buf, start, end, count = self.pieces[i]
+            line = self.lines[i] + buf.count('\n', start, start + rel) + 1
+        return f'{line}.{offset - self.line_offset(line)}'
+    
+    def chunks(self, start=0, end=None):
+        # The text between two offsets, piece by piece
+        end = self.length if end is None else min(end, self.length)
+        i, rel = self.locate(start)
+        remaining = end - start
+        while remaining > 0:
+            buf, first, last, count = self.pieces[i]
+            first += rel
+            last = min(last, first + remaining)
+            yield buf[first:last]
+            remaining -= last - first
+            rel = 0
+            i += 1
+    
+    def get(self, start=0, end=None):
+        return ''.join(self.chunks(start, end))
+    
+    def text(self):
+        return self.get()
+    
+    def line(self, line):
+        return self.get(self.line_offset(line), self.line_offset(line + 1)).rstrip('\n')
+    
+    def iter_lines(self, first=1):
+        partial = ''
+        for chunk in self.chunks(self.line_offset(first)):
+            lines = (partial + chunk).split('\n')
+            partial = lines.pop()
+            yield from lines
+        yield partial
+    
+    def on_change(self, change):
+        start = self.offset(change.start)
+        if change.op != 'insert':
+            self.delete(start, self.offset(change.end))
+        self.insert(start, change.text)
+
+
+def text_chunks(text):
+    # Strings and documents alike, as an iterable of strings
+    return [text] if isinstance(text, str) else text.chunks()
+
+
+FIRST_CHUNK_SIZE = 16 * 1024
+LOAD_CHUNK_SIZE = 256 * 1024
+SAVE_CHUNK_SIZE = 1024 * 1024
+BACKGROUND_SAVE_SIZE = 4 * 1024 * 1024
+
+def tag_spans(widget, tag, spans, batch=5000):
+    # tag add accepts many ranges per call, so tags go on in a few bulk calls
+    for i in range(0, len(spans), batch):
+        widget.tag_add(tag, *[index for span in spans[i:i + batch] for index in span])
+
+
+class SuggestionService:
+    # Spelling corrections on top of the shared checker. candidates() is an
+    # edit-distance search, so results are memoized in an LRU that is saved
+    # to disk and reloaded next session.
+    def __init__(self, cache_file, maxsize=2000, limit=8):
+        self.cache_file = cache_file
+        self.cache = LRUCache(maxsize)
+        self.limit = limit
+        self.changed = False
+        self.load()
+    
+    def suggest(self, word):
+        key = word.lower()
+        suggestions = self.cache.get(key)
+        if suggestions is None:
+            checker = get_spell_checker()
+            candidates = (checker.candidates(key) or set()) - {key}
+            suggestions = sorted(candidates, key=lambda w: (-checker[w], w))[:self.limit]
+            self.cache.put(key, suggestions)
+            self.changed = True
+        return suggestions
+    
+    def load(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                # Stored oldest first, so re-inserting keeps the LRU order
+                for word, suggestions in json.load(f).get('suggestions', []):
+                    self.cache.put(word, suggestions)
+        except:
+            pass
+    
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            with open(self.cache_file, 'w') as f:
+                json.dump({'suggestions': list(self.cache.data.items())}, f)
+            self.changed = False
+        except:
+            pass
+
+
+def match_case(word, template):
+    if template.isupper() and len(template) > 1:
+        return word.upper()
+    if template[:1].isupper():
+        return word[:1].upper() + word[1:]
+    return word
+
+
+class LiveChecker(abc.ABC):
+    # Base of the as-you-type checkers. One checker serves every tab: it is
+    # attached to the visible Text widget. Edits mark lines dirty; after a
+    # pause of delay ms check_lines() gets the visible lines plus up to
+    # batch_lines dirty ones, and clear() removes its tags when disabled.
+    # An edit spanning more lines than that (a paste, Replace All) turns into
+    # a rescan from its first line to the end, batch_lines at a time, and
+    # edits made while loading() is true are left to the reset after the load.
+    def __init__(self, root, delay, batch_lines):
+        self.root = root
+        self.text = None
+        self.hook = None
+        self.loading = None
+        self.delay = delay
+        self.batch_lines = batch_lines
+        self.dirty = set()
+        self.rescan = None
+        self.enabled = False
+        self.pending = None
+    
+    def attach(self, text, hook, loading=None):
+        if self.hook is not None and self.on_change in self.hook.listeners:
+            self.hook.listeners.remove(self.on_change)
+        self.text = text
+        self.hook = hook
+        self.loading = loading
+        if hook is not None:
+            hook.listeners.append(self.on_change)
+        if self.enabled:
+            self.reset()
+    
+    def enable(self, enabled=True):
+        self.enabled = enabled
+        if enabled:
+            self.reset()
+        else:
+            if self.pending:
+                self.root.after_cancel(self.pending)
+                self.pending = None
+            self.dirty.clear()
+            self.rescan = None
+            if self.text is not None:
+                self.clear()
+    
+    def reset(self):
+        # Forget edit history (e.g. after a file load) and check what is on screen
+        self.dirty.clear()
+        self.rescan = None
+        self.schedule()
+    
+    def on_change(self, change):
+        if not self.enabled or (self.loading and self.loading()):
+            return
+        if self.rescan is not None:
+            if change.old_last < self.rescan:
+                self.rescan += change.new_last - change.old_last
+            elif change.first_line < self.rescan:
+                self.rescan = change.first_line
+        if max(change.old_last, change.new_last) - change.first_line < self.batch_lines:
+            if change.new_last != change.old_last:
+                self.dirty = shift_lines(self.dirty, change)
+            self.dirty.update(range(change.first_line, change.new_last + 1))
+            first = min(self.dirty) if len(self.dirty) > self.batch_lines else None
+        else:
+            first = change.first_line
+        if first is not None:
+            self.rescan = first if self.rescan is None else min(first, self.rescan)
+            self.dirty = {line for line in self.dirty if line < first}
+        self.schedule()
+    
+    def on_scroll(self):
+        if self.enabled:
+            self.schedule()
+    
+    def schedule(self, delay=None):
+        if self.pending:
+            self.root.after_cancel(self.pending)
+        self.pending = self.root.after(self.delay if delay is None else delay, self.check)
+    
+    def visible_lines(self):
+        top = int(self.text.index('@0,0').split('.')[0])
+        bottom = int(self.text.index(f'@0,{self.text.winfo_height()}').split('.')[0])
+        return range(top, bottom + 1)
+    
+    def check(self):
+        self.pending = None
+        if not self.enabled or self.text is None:
+            return
+        last_line = int(self.text.index('end-1c').split('.')[0])
+        lines = set(self.visible_lines())
+        for line in sorted(self.dirty)[:self.batch_lines]:
+            lines.add(line)
+            self.dirty.discard(line)
+        if self.rescan is not None:
+            stop = min(self.rescan + self.batch_lines, last_line + 1)
+            lines.update(range(self.rescan, stop))
+            self.rescan = stop if stop <= last_line else None
+        self.check_lines([line for line in sorted(lines) if line <= last_line])
+    
+    def unchecked(self):
+        return bool(self.dirty) or self.rescan is not None
+    
+    @abc.abstractmethod
+    def check_lines(self, lines):
+        pass
+    
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+
+class LiveSpellChecker(LiveChecker):
+    # As-you-type spell checking. Lines are re-tagged from cached verdicts;
+    # words without a verdict are looked up on a worker thread and handed
+    # back through a queue polled with root.after.
+    def __init__(self, root, delay=400, batch_lines=2000, cache_size=50000):
+        super().__init__(root, delay, batch_lines)
+        self.verdicts = LRUCache(cache_size)
+        self.waiting = set()
+        self.polling = False
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.worker = None
+    
+    def enable(self, enabled=True):
+        if enabled and self.worker is None:
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+        super().enable(enabled)
+    
+    def clear(self):
+        self.text.tag_remove('misspelled', '1.0', tk.END)
+    
+    def check_lines(self, lines):
+        spans, missing, incomplete = [], set(), set()
+        for line in lines:
+            self.text.tag_remove('misspelled', f'{line}.0', f'{line}.end')
+            for _, start, end, word in iter_words(self.text.get(f'{line}.0', f'{line}.end'), line):
+                verdict = self.verdicts.get(word.lower())
+                if verdict is None:
+                    missing.add(word.lower())
+                    incomplete.add(line)
+                elif verdict:
+                    spans.append((f'{line}.{start}', f'{line}.{end}'))
+        tag_spans(self.text, 'misspelled', spans)
+        
+        # Lines with unchecked words are revisited once the worker answers
+        self.dirty.update(incomplete)
+        missing -= self.waiting
+        if missing:
+            self.waiting |= missing
+            self.requests.put(missing)
+            if not self.polling:
+                self.polling = True
+                self.root.after(50, self.poll_results)
+        elif self.unchecked() and not self.waiting:
+            self.schedule()
+    
+    def poll_results(self):
+        answered = False
+        while True:
+            try:
+                verdicts = self.results.get_nowait()
+            except queue.Empty:
+                break
+            for word, misspelled in verdicts.items():
+                self.verdicts.put(word, misspelled)
+            self.waiting -= verdicts.keys()
+            answered = True
+        if self.waiting:
+            self.root.after(50, self.poll_results)
+        else:
+            self.polling = False
+        if answered and self.enabled:
+            self.schedule(0)
+    
+    def run(self):
+        while True:
+            words = self.requests.get()
+            unknown = get_spell_checker().unknown(words)
+            self.results.put({word: word in unknown for word in words})
+
+
+def tag_grammar(widget, issues):
+    # 'grammar' draws the underline; a tag per rule says which rule fired
+    spans = {}
+    for line, start, end, name in issues:
+        spans.setdefault(name, []).append((f'{line}.{start}', f'{line}.{end}'))
+    for name, rule_spans in spans.items():
+        tag_spans(widget, 'grammar', rule_spans)
+        tag_spans(widget, f'grammar:{name}', rule_spans)
+    return sum(len(rule_spans) for rule_spans in spans.values())
+
+
+def clear_grammar(widget, checker, start='1.0', end=tk.END):
+    widget.tag_remove('grammar', start, end)
+    for name in checker.rules:
+        widget.tag_remove(f'grammar:{name}', start, end)
+
+
+class LiveGrammarChecker(LiveChecker):
+    # Keeps grammar tags current while typing; unchanged sentences come
+    # straight from the checker's cache
+    def __init__(self, root, checker, delay=500, batch_lines=2000):
+        super().__init__(root, delay, batch_lines)
+        self.checker = checker
+    
+    def clear(self):
+        clear_grammar(self.text, self.checker)
+    
+    def check_lines(self, lines):
+        text = self.text
+        issues = []
+        for line in lines:
+            clear_grammar(text, self.checker, f'{line}.0', f'{line}.end')
+            previous = text.get(f'{line - 1}.0', f'{line - 1}.end') if line > 1 else ''
+            issues.extend(self.checker.line_issues(text.get(f'{line}.0', f'{line}.end'), line,
+                                                   self.checker.continues(previous)))
+        tag_grammar(text, issues)
+        if self.unchecked():
+            self.schedule()
+
+
+class SpeechPipeline:
+    # Speaks sentences one at a time on a thread that owns the pyttsx3
+    # engine, so runAndWait() never blocks Tk. The Tk side decides what to
+    # say next; `active` names the sentence that should currently be heard,
+    # and the worker stops any utterance that no longer matches it.
+    def __init__(self, root, on_event, rate=None):
+        self.root = root
+        self.on_event = on_event
+        self.rate = rate
+        self.sentences = []
+        self.position = 0
+        self.generation = 0
+        self.active = None
+        self.current = None
+        self.paused = False
+        self.polling = False
+        self.thread = None
+        self.commands = queue.Queue()
+        self.events = queue.Queue()
+    
+    @property
+    def speaking(self):
+        return self.active is not None or self.paused
+    
+    def speak(self, sentences):
+        self.stop()
+        self.sentences = sentences
+        self.position = 0
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.send()
+    
+    def send(self):
+        if self.position >= len(self.sentences):
+            self.stop()
+            return
+        self.active = (self.generation, self.position)
+        start, end, text = self.sentences[self.position]
+        self.commands.put((self.active, text))
+        self.on_event('sentence', (start, end))
+        if not self.polling:
+            self.polling = True
+            self.root.after(50, self.poll)
+    
+    def pause(self):
+        # Toggles; resuming repeats the interrupted sentence from its start
+        if self.paused:
+            self.paused = False
+            self.send()
+        elif self.active is not None:
+            self.paused = True
+            self.active = None
+    
+    def skip(self):
+        if self.active is not None:
+            self.position += 1
+            self.send()
+    
+    def stop(self):
+        was_speaking = self.speaking
+        self.generation += 1
+        self.active = None
+        self.paused = False
+        self.sentences = []
+        if was_speaking:
+            self.on_event('finished', None)
+    
+    def set_rate(self, rate):
+        # Picked up by the worker before the next sentence
+        self.rate = rate
+    
+    def poll(self):
+        while True:
+            try:
+                kind, token, error = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'error':
+                if token is None:
+                    self.thread = None
+                self.stop()
+                self.on_event('error', error)
+            elif token == self.active:
+                self.position += 1
+                self.send()
+        if self.active is not None:
+            self.root.after(50, self.poll)
+        else:
+            self.polling = False
+    
+    def run(self):
+        try:
+            engine = get_speech_engine()
+            engine.connect('started-word', self.on_word)
+        except Exception as e:
+            self.events.put(('error', None, e))
+            return
+        rate = None
+        while True:
+            token, text = self.commands.get()
+            if token != self.active:
+                continue
+            if self.rate is not None and self.rate != rate:
+                rate = self.rate
+                engine.setProperty('rate', rate)
+            self.current = token
+            try:
+                engine.say(text)
+                engine.runAndWait()
+            except Exception as e:
+                self.events.put(('error', token, e))
+                continue
+            self.events.put(('done', token, None))
+    
+    def on_word(self, name, location, length):
+        if self.current != self.active:
+            get_speech_engine().stop()
+
+
+def compile_search(text, match_case=False, whole_word=False, regex=False):
+    # Raises re.error for an invalid regular expression
+    source = text if regex else re.escape(text)
+    if whole_word:
+        source = rf'\b(?:{source})\b'
+    return re.compile(source, re.MULTILINE | (0 if match_case else re.IGNORECASE))
+
+
+def can_span_lines(text, regex=False):
+    # Whether a search might match across a line break. Errs towards yes:
+    # \s, \W, \D, [^...] and (?s) can all reach past the end of a line.
+    if '\n' in text:
+        return True
+    return regex and re.search(r'\\(?:[nsWD]|[xX]0[aA]|u000[aA]|0?12)|\[\^|\(\?[aiLmux]*s', text) is not None
+
+
+def replace_all(widget, text, pattern, replacement, expand=False):
+    # Rewrites only the matched ranges, as one undo step; text is the widget's
+    # contents, e.g. from its PieceTable. Matches starting on the same line are
+    # merged into a single replace call, and groups are applied back to front
+    # so earlier indices stay valid. With expand=True the replacement may use
+    # \1 / \g<name> group references.
+    groups = []
+    count = 0
+    for line, col, _, match in iter_matches(pattern, text):
+        new = match.expand(replacement) if expand else replacement
+        if new == match.group():
+            continue
+        count += 1
+        if groups and groups[-1][0] == line:
+            group = groups[-1]
+            group[3].append(text[group[2]:match.start()])
+            group[3].append(new)
+            group[2] = match.end()
+        else:
+            groups.append([line, col, match.end(), [new], match.start()])
+    if not groups:
+        return 0
+    
+    widget.config(autoseparators=False)
+    widget.edit_separator()
+    try:
+        for line, col, end, pieces, start in reversed(groups):
+            index = f'{line}.{col}'
+            widget.replace(index, f'{index}+{end - start}c', ''.join(pieces))
+    finally:
+        widget.edit_separator()
+        widget.config(autoseparators=True)
+    return count
+
+
+class LineTransform:
+    # A transform run by TransformJob. process() is called with consecutive
+    # chunks of lines and returns what replaces each chunk; returning the
+    # same lines leaves that chunk untouched.
+    label = "Transform"
+    
+    def prepare(self, lines):
+        # Gets all lines up front; only transforms that need them use it
+        pass
+    
+    def process(self, lines):
+        return lines
+
+
+class CaseTransform(LineTransform):
+    def __init__(self, label, convert):
+        self.label = label
+        self.convert = convert
+    
+    def process(self, lines):
+        return [self.convert(line) for line in lines]
+
+
+class TrimTransform(LineTransform):
+    label = "Trim trailing whitespace"
+    
+    def process(self, lines):
+        return [line.rstrip() for line in lines]
+
+
+class DedupeTransform(LineTransform):
+    # Keeps the first occurrence of every line
+    label = "Remove duplicate lines"
+    
+    def __init__(self):
+        self.seen = set()
+    
+    def process(self, lines):
+        kept = []
+        for line in lines:
+            if line not in self.seen:
+                self.seen.add(line)
+                kept.append(line)
+        return kept
+
+
+class SortTransform(LineTransform):
+    # Sorted up front, then written back chunk by chunk like the others
+    label = "Sort lines"
+    
+    def __init__(self):
+        self.sorted = []
+        self.position = 0
+    
+    def prepare(self, lines):
+        lines = list(lines)
+        # A final newline stays at the end instead of sorting to the top
+        trailing = [lines.pop()] if len(lines) > 1 and lines[-1] == '' else []
+        self.sorted = sorted(lines) + trailing
+    
+    def process(self, lines):
+        chunk = self.sorted[self.position:self.position + len(lines)]
+        self.position += len(lines)
+        return chunk
+
+
+TRANSFORMS = {
+    'upper': lambda: CaseTransform("UPPERCASE", str.upper),
+    'lower': lambda: CaseTransform("lowercase", str.lower),
+    'title': lambda: CaseTransform("Title Case", str.title),
+    'trim': TrimTransform,
+    'dedupe': DedupeTransform,
+    'sort': SortTransform,
+}
+
+
+class TransformJob:
+    # Runs a LineTransform over lines first..last of a Text widget in chunks
+    # of chunk_lines, reading from the tab's PieceTable. Only chunks that
+    # change are replaced. Between time slices the event loop runs; the
+    # widget is read-only meanwhile and the whole run is one undo step.
+    def __init__(self, root, text, document, transform, first=1, last=None, chunk_lines=2000,
+                 on_progress=None, on_done=None, slice_time=0.03):
+        self.root = root
+        self.text = text
+        self.document = document
+        self.transform = transform
+        self.line = first
+        self.last = document.line_count if last is None else last
+        self.total = self.last - first + 1
+        self.done_lines = 0
+        self.chunk_lines = chunk_lines
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.slice_time = slice_time
+        self.changed = 0
+        self.cancelled = False
+    
+    @property
+    def progress(self):
+        return self.done_lines * 100 // max(self.total, 1)
+    
+    def start(self):
+        self.transform.prepare(itertools.islice(self.document.iter_lines(self.line), self.total))
+        self.text.config(autoseparators=False)
+        self.text.edit_separator()
+        self.text.config(state=tk.DISABLED)
+        self.root.after(1, self.step)
+    
+    def cancel(self):
+        # Stops after the chunks done so far, which stay one undo step
+        if not self.cancelled:
+            self.cancelled = True
+            self.finish()
+    
+    def step(self):
+        if self.cancelled:
+            return
+        deadline = time.perf_counter() + self.slice_time
+        self.text.config(state=tk.NORMAL)
+        try:
+            while self.done_lines < self.total and time.perf_counter() < deadline:
+                self.apply_chunk(min(self.chunk_lines, self.total - self.done_lines))
+        finally:
+            self.text.config(state=tk.DISABLED)
+        
+        if self.done_lines < self.total:
+            if self.on_progress:
+                self.on_progress(self.progress)
+            self.root.after(1, self.step)
+        else:
+            self.finish()
+    
+    def apply_chunk(self, count):
+        document = self.document
+        line = self.line
+        at_end = line + count > document.line_count
+        text = document.get(document.line_offset(line), document.line_offset(line + count))
+        lines = text.split('\n')
+        if not at_end:
+            # Drop the empty string after the chunk's last newline
+            lines.pop()
+        new = self.transform.process(lines)
+        self.done_lines += count
+        if new == lines:
+            self.line += count
+            return
+        
+        self.changed += 1
+        if not at_end:
+            self.text.replace(f'{line}.0', f'{line + count}.0', ''.join(f'{l}\n' for l in new))
+        elif new or line == 1:
+            self.text.replace(f'{line}.0', 'end-1c', '\n'.join(new))
+        else:
+            # The last lines went away: take the newline before them too
+            self.text.delete(f'{line - 1}.end', 'end-1c')
+        self.line += len(new)
+    
+    def finish(self):
+        self.text.config(state=tk.NORMAL)
+        self.text.edit_separator()
+        self.text.config(autoseparators=True)
+        if self.on_done:
+            self.on_done(self)
+
+
+class FindEngine:
+    # Match index behind Find: the buffer is searched once, then only lines
+    # touched by an edit are searched again. Matches are (line, col, length)
+    # tuples kept sorted. Only max_highlights matches get a 'found' tag, so
+    # huge result sets do not stall rendering. A pattern that can match
+    # across lines is searched again in full after every edit.
+    def __init__(self, hook, max_highlights=2000):
+        self.hook = hook
+        self.widget = hook.widget
+        self.max_highlights = max_highlights
+        self.key = None
+        self.pattern = None
+        self.multiline = False
+        self.matches = []
+        hook.listeners.append(self.on_change)
+    
+    def set_pattern(self, text, match_case=False, whole_word=False, regex=False):
+        key = (text, match_case, whole_word, regex)
+        if key == self.key:
+            return
+        self.pattern = compile_search(text, match_case, whole_word, regex)
+        self.multiline = can_span_lines(text, regex)
+        self.key = key
+        self.search()
+    
+    def clear(self):
+        self.key = self.pattern = None
+        self.matches = []
+        self.widget.tag_remove('found', '1.0', tk.END)
+    
+    def search(self):
+        self.matches = self.scan(str(self.hook.call('get', '1.0', 'end-1c')), 1)
+        self.highlight()
+    
+    def scan(self, text, first_line):
+        return [(line, start, end - start)
+                for line, start, end, _ in iter_matches(self.pattern, text, first_line) if end > start]
+    
+    @staticmethod
+    def span(match):
+        line, col, length = match
+        return f'{line}.{col}', f'{line}.{col}+{length}c'
+    
+    def window(self):
+        # The slices of matches that get tagged: from the top of the view
+        # onwards, then wrapping to the start
+        top = int(self.widget.index('@0,0').split('.')[0])
+        i = bisect.bisect_left(self.matches, (top,))
+        end = min(len(self.matches), i + self.max_highlights)
+        return slice(i, end), slice(0, min(i, self.max_highlights - (end - i)))
+    
+    def highlight(self):
+        self.widget.tag_remove('found', '1.0', tk.END)
+        after, before = self.window()
+        tag_spans(self.widget, 'found', [self.span(m) for m in self.matches[after] + self.matches[before]])
+    
+    def locate(self, line, col, backwards=False):
+        # Index of the first match at/after (line, col), or the last one before it
+        if not self.matches:
+            return None
+        i = bisect.bisect_left(self.matches, (line, col))
+        return (i - 1) % len(self.matches) if backwards else i % len(self.matches)
+    
+    def on_change(self, change):
+        if self.pattern is None:
+            return
+        if self.multiline:
+            self.search()
+            return
+        first, old_last, new_last = change.first_line, change.old_last, change.new_last
+        text = self.hook.call('get', f'{first}.0', f'{new_last}.end')
+        fresh = self.scan(str(text), first)
+        lo = bisect.bisect_left(self.matches, (first,))
+        hi = bisect.bisect_left(self.matches, (old_last + 1,))
+        delta = new_last - old_last
+        if delta:
+            self.matches[lo:] = fresh + [(line + delta, col, length) for line, col, length in self.matches[hi:]]
+        else:
+            self.matches[lo:hi] = fresh
+        self.widget.tag_remove('found', f'{first}.0', f'{new_last}.end')
+        # Tag the fresh matches inside the window; as many matches past the
+        # end of each slice may have been pushed out of it, so untag those
+        after, before = self.window()
+        hi = lo + len(fresh)
+        tag_spans(self.widget, 'found', [self.span(m) for part in (after, before)
+                                         for m in self.matches[max(lo, part.start):min(hi, part.stop)]])
+        for part, limit in ((after, len(self.matches)), (before, after.start)):
+            pushed = self.matches[part.stop:min(part.stop + len(fresh), limit)]
+            if pushed:
+                self.widget.tag_remove('found', self.span(pushed[0])[0], self.span(pushed[-1])[1])
+
+
+class AutoSaver:
+    # Writes buffer snapshots on a worker thread with atomic_write. A snapshot
+    # whose hash matches the last one written for the same key is skipped;
+    # on_saved(written) runs on the worker afterwards.
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.hashes = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def submit(self, key, file_path, text, encoding, on_saved=None, newline=os.linesep):
+        self.jobs.put((key, self.generations.get(key, 0), file_path, text, encoding, newline, on_saved))
+    
+    def cancel(self, key):
+        # Called before an explicit save: queued snapshots of key are dropped
+        # so they cannot overwrite the newer content afterwards
+        with self.lock:
+            self.generations[key] = self.generations.get(key, 0) + 1
+            self.hashes.pop(key, None)
+    
+    def run(self):
+        while True:
+            key, generation, file_path, text, encoding, newline, on_saved = self.jobs.get()
+            digest = hashlib.blake2b(digest_size=16)
+            for chunk in text_chunks(text):
+                digest.update(chunk.encode('utf-8', 'surrogatepass'))
+            digest = digest.digest()
+            try:
+                with self.lock:
+                    if generation != self.generations.get(key, 0):
+                        continue
+                    written = self.hashes.get(key) != digest
+                    if written:
+                        atomic_write(file_path, text, encoding, newline)
+                        self.hashes[key] = digest
+                if on_saved:
+                    on_saved(written)
+            except Exception:
+                pass
+
+
+class SettingsStore:
+    # A JSON file written through the AutoSaver. save() only schedules a
+    # write, so any number of changes within delay ms cost one write (and
+    # none if the JSON comes out the same); flush(wait=True) writes on the
+    # calling thread, for exit. collect() returns the data to store.
+    def __init__(self, root, file_path, collect, autosaver, delay=1000):
+        self.root = root
+        self.file_path = file_path
+        self.collect = collect
+        self.autosaver = autosaver
+        self.delay = delay
+        self.job = None
+    
+    def load(self, *legacy_paths):
+        # A file found only at a legacy path is moved over on the next write
+        for path in (self.file_path,) + legacy_paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if path != self.file_path:
+                self.save()
+            return data
+        return {}
+    
+    def save(self):
+        if self.job is None:
+            self.job = self.root.after(self.delay, self.flush)
+    
+    def flush(self, wait=False):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+        text = json.dumps(self.collect())
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        if wait:
+            self.autosaver.cancel(self.file_path)
+            with self.autosaver.lock:
+                atomic_write(self.file_path, text)
+        else:
+            self.autosaver.submit(self.file_path, self.file_path, text, 'utf-8')
+
+
+class InstanceServer:
+    # Listens on the instance socket for the files of later launches (see
+    # hand_off). Tk watches the listening socket and each client socket
+    # itself, so nothing polls or blocks; each message is one JSON line,
+    # answered before open_files(paths) runs. A client that has not sent its
+    # line within timeout_ms is dropped.
+    def __init__(self, root, path, open_files, timeout_ms=2000, max_message=1 << 20):
+        self.root = root
+        self.path = path
+        self.open_files = open_files
+        self.timeout_ms = timeout_ms
+        self.max_message = max_message
+        self.clients = {}
+        # A socket file nobody answers on was left behind by a crash
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except OSError:
+                pass
+            else:
+                raise OSError(f"another instance is listening on {path}")
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(8)
+        root.tk.createfilehandler(self.sock, tk.READABLE, self.accept)
+    
+    def accept(self, sock, mask):
+        try:
+            conn, _ = self.sock.accept()
+        except OSError:
+            return
+        conn.setblocking(False)
+        self.clients[conn] = (bytearray(), self.root.after(self.timeout_ms, self.drop, conn))
+        self.root.tk.createfilehandler(conn, tk.READABLE, self.read)
+    
+    def read(self, conn, mask):
+        data = self.clients[conn][0]
+        try:
+            chunk = conn.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b''
+        data += chunk
+        if chunk and not data.endswith(b'\n') and len(data) < self.max_message:
+            return
+        try:
+            files = json.loads(bytes(data))['files']
+            if not isinstance(files, list) or not all(isinstance(path, str) for path in files):
+                raise TypeError(files)
+            conn.sendall(b'ok\n')
+        except (OSError, ValueError, KeyError, TypeError):
+            files = None
+        self.drop(conn)
+        if files is not None:
+            self.root.after_idle(self.open_files, files)
+    
+    def drop(self, conn):
+        if conn not in self.clients:
+            return
+        self.root.after_cancel(self.clients.pop(conn)[1])
+        self.root.tk.deletefilehandler(conn)
+        conn.close()
+    
+    def close(self):
+        try:
+            for conn in list(self.clients):
+                self.drop(conn)
+            self.root.tk.deletefilehandler(self.sock)
+        except tk.TclError:
+            pass
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class RecoveryError(Exception):
+    pass
+
+
+class RecoveryJournal:
+    # Crash recovery for a buffer. Every edit is appended to a journal
+    # segment. Taking an autosave snapshot starts a new segment, and once the
+    # snapshot is on disk the state file moves its base forward and older
+    # segments are deleted. After a crash, the base (the file itself, or the
+    # snapshot for untitled buffers) plus the remaining segments reproduce
+    # the buffer. A clean exit removes everything.
+    def __init__(self, directory, session):
+        self.directory = directory
+        self.session = session
+        self.state = None
+        self.chain = 0
+        self.seq = 0
+        self.file = None
+        self.dirty = False
+        self.lock = threading.Lock()
+    
+    def path(self, name, session=None):
+        return os.path.join(self.directory, f'{session or self.session}.{name}')
+    
+    def start(self, file_path, encoding):
+        # Begin a new chain whose base is file_path as it is on disk now
+        self.stop()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            state = {'pid': os.getpid(), 'path': file_path, 'encoding': encoding,
+                     'base_seq': 0, 'snapshot': None}
+            if file_path:
+                stat = os.stat(file_path)
+                state.update(base_size=stat.st_size, base_mtime=stat.st_mtime)
+            with self.lock:
+                self.chain += 1
+                self.seq = 0
+                self.state = state
+                atomic_write(self.path('state.json'), json.dumps(state))
+            self.file = open(self.path('0.journal'), 'a', encoding='utf-8')
+        except OSError:
+            self.file = None
+    
+    def stop(self):
+        # Drops the current chain (clean close, file reloaded, large file view)
+        self.close_segment()
+        with self.lock:
+            self.chain += 1
+            self.state = None
+        self.remove_files(self.directory, self.session)
+    
+    def close_segment(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+    
+    def record(self, change):
+        if self.file is None:
+            return
+        self.file.write(json.dumps([change.op, change.start, change.end, change.text]) + '\n')
+        self.dirty = True
+    
+    def flush(self):
+        if self.file is not None and self.dirty:
+            self.file.flush()
+            self.dirty = False
+    
+    def rotate(self):
+        # A snapshot is being taken: later edits go to a new segment
+        if self.file is None:
+            return None
+        self.close_segment()
+        self.seq += 1
+        self.file = open(self.path(f'{self.seq}.journal'), 'a', encoding='utf-8')
+        return self.chain, self.seq
+    
+    def snapshot_path(self, seq):
+        return self.path(f'{seq}.snapshot')
+    
+    def commit(self, token, snapshot=None):
+        # Runs on the autosave thread once the content preceding segment `seq`
+        # is on disk: in the file itself, or in a new snapshot for untitled
+        # buffers (None keeps the previous, identical snapshot)
+        chain, seq = token
+        with self.lock:
+            if chain != self.chain or self.state is None:
+                return
+            state = dict(self.state, base_seq=seq)
+            if snapshot:
+                state['snapshot'] = snapshot
+            if state['path']:
+                stat = os.stat(state['path'])
+                state.update(base_size=stat.st_size, base_mtime=stat.st_mtime)
+            atomic_write(self.path('state.json'), json.dumps(state))
+            self.state = state
+        for name in glob.glob(self.path('*.journal')) + glob.glob(self.path('*.snapshot')):
+            if name != state['snapshot'] and int(os.path.basename(name).split('.')[-2]) < seq:
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+    
+    @staticmethod
+    def remove_files(directory, session):
+        for name in glob.glob(os.path.join(glob.escape(directory), f'{glob.escape(session)}.*')):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+    
+    @staticmethod
+    def stale_sessions(directory):
+        sessions = []
+        for name in glob.glob(os.path.join(glob.escape(directory), '*.state.json')):
+            try:
+                with open(name, 'r') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if state.get('pid') == os.getpid() or process_alive(state.get('pid', 0)):
+                continue
+            sessions.append((os.path.getmtime(name), os.path.basename(name)[:-len('.state.json')], state))
+        return [(session, state) for _, session, state in sorted(sessions, reverse=True)]
+    
+    @staticmethod
+    def load(directory, session, state):
+        # Returns (base text, [op, ...]) for a crashed session
+        if state['path']:
+            stat = os.stat(state['path'])
+            if (stat.st_size, stat.st_mtime) != (state.get('base_size'), state.get('base_mtime')):
+                raise RecoveryError(f"{state['path']} was changed on disk after the crash")
+            with open(state['path'], 'r', encoding=state['encoding'], errors='replace') as f:
+                base = f.read()
+        elif state['snapshot']:
+            with open(state['snapshot'], 'r', encoding=state['encoding'], errors='replace') as f:
+                base = f.read()
+        else:
+            base = ''
+        
+        ops = []
+        seq = state['base_seq']
+        while os.path.exists(os.path.join(directory, f'{session}.{seq}.journal')):
+            with open(os.path.join(directory, f'{session}.{seq}.journal'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        ops.append(json.loads(line))
+                    except ValueError:
+                        # A torn last line from the crash
+                        break
+            seq += 1
+        return base, ops
+
+
+class FileLoader:
+    # Reads and decodes a file on a worker thread. The Tk side drains the
+    # bounded chunk queue from root.after callbacks, so at most a few chunks
+    # are held in memory besides the widget contents. With a preview the
+    # widget already shows the file's start: that much is skipped, unless the
+    # file turns out to differ, in which case RESTART comes first.
+    RESTART = object()
+    
+    def __init__(self, file_path, encoding, preview=None):
+        self.file_path = file_path
+        self.encoding = encoding
+        self.preview = preview
+        self.newlines = None
+        self.size = os.path.getsize(file_path)
+        self.bytes_read = 0
+        self.error = None
+        self.chunks = queue.Queue(maxsize=16)
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def cancel(self):
+        self.cancelled.set()
+    
+    @property
+    def progress(self):
+        return min(100, self.bytes_read * 100 // self.size) if self.size else 100
+    
+    def run(self):
+        try:
+            with open(self.file_path, 'r', encoding=self.encoding, errors='replace') as file:
+                if self.preview:
+                    head = file.read(len(self.preview))
+                    if head != self.preview:
+                        self.put(self.RESTART)
+                        self.put(head)
+                    self.bytes_read = file.buffer.tell()
+                # A small first chunk gets the first screen up quickly
+                size = FIRST_CHUNK_SIZE
+                while not self.cancelled.is_set():
+                    chunk = file.read(size)
+                    if not chunk:
+                        break
+                    self.bytes_read = file.buffer.tell()
+                    self.put(chunk)
+                    size = LOAD_CHUNK_SIZE
+                self.newlines = file.newlines
+        except Exception as e:
+            self.error = e
+        self.put(None)
+    
+    def put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+class FileSaver:
+    # Writes a document snapshot with atomic_write, on a worker thread once
+    # started or inline through run(). stats fill in as it goes, for the
+    # progress display and the throughput report.
+    def __init__(self, file_path, text, encoding, newline):
+        self.file_path = file_path
+        self.text = text
+        self.encoding = encoding
+        self.newline = newline
+        self.stats = WriteStats()
+        self.error = None
+        self.done = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    @property
+    def progress(self):
+        return min(100, self.stats.chars * 100 // len(self.text)) if len(self.text) else 100
+    
+    def run(self):
+        try:
+            atomic_write(self.file_path, self.text, self.encoding, self.newline, self.stats)
+        except Exception as e:
+            self.error = e
+        self.done = True
+
+
+LARGE_FILE_THRESHOLD = 64 * 1024 * 1024
+PREVIEW_SIZE = 4 * 1024
+SAVE_ENCODINGS = ('utf-8', 'utf-8-sig', 'utf-16', 'cp1252', 'latin-1')
+LINE_ENDINGS = (("LF (Unix, macOS)", '\n'), ("CRLF (Windows)", '\r\n'))
+MAX_FILE_STATES = 100
+INDEX_BLOCK_SIZE = 256 * 1024
+MAX_LINE_BYTES = 16 * 1024
+
+
+class LineIndex:
+    # Sparse line index over a memory-mapped file: the number of newlines
+    # before each fixed-size block, built on a worker thread. Finding a line
+    # is a binary search over blocks plus a scan of one block.
+    def __init__(self, mm, block_size=INDEX_BLOCK_SIZE):
+        self.mm = mm
+        self.size = len(mm)
+        self.block_size = block_size
+        self.block_lines = [0]
+        self.indexed = 0
+        self.done = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def run(self):
+        pos = count = 0
+        while pos < self.size and not self.closed:
+            end = min(pos + self.block_size, self.size)
+            count += self.mm[pos:end].count(b'\n')
+            self.block_lines.append(count)
+            self.indexed = pos = end
+        self.done = not self.closed
+    
+    def close(self):
+        self.closed = True
+        self.thread.join()
+    
+    @property
+    def line_count(self):
+        newlines = self.block_lines[-1]
+        if not self.done:
+            # Extrapolate while the index is still being built
+            return max(newlines + 1, newlines * self.size // max(self.indexed, 1))
+        return newlines + (0 if self.mm[self.size - 1:self.size] == b'\n' else 1)
+    
+    def line_offset(self, line):
+        if line == 0:
+            return 0
+        block = bisect.bisect_left(self.block_lines, line) - 1
+        if block + 1 >= len(self.block_lines):
+            return None
+        pos = block * self.block_size
+        for _ in range(line - self.block_lines[block]):
+            pos = self.mm.find(b'\n', pos) + 1
+        return pos
+    
+    def read_lines(self, first, count, encoding):
+        pos = self.line_offset(first)
+        if pos is None:
+            return None
+        lines = []
+        while len(lines) < count and pos < self.size:
+            newline = self.mm.find(b'\n', pos)
+            end = self.size if newline < 0 else newline
+            line = self.mm[pos:min(end, pos + MAX_LINE_BYTES)].decode(encoding, 'replace').rstrip('\r')
+            if end - pos > MAX_LINE_BYTES:
+                line += ' \u2026'
+            lines.append(line)
+            pos = end + 1
+        return lines
+
+
+class LargeFileView:
+    # Read-only view of a memory-mapped file. Only a window of lines around
+    # the visible area lives in the Text widget, and the scrollbar is driven
+    # by the line index rather than by the widget's contents.
+    def __init__(self, text, scrollbar, file_path, encoding, window_lines=3000, on_scroll=None):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.on_scroll = on_scroll
+        self.encoding = encoding
+        self.window_lines = window_lines
+        self.margin = window_lines // 6
+        self.window_start = 0
+        self.window_count = 0
+        self.moving = False
+        
+        self.file = open(file_path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = LineIndex(self.mm)
+        
+        self.yscrollcommand = self.text.cget('yscrollcommand')
+        self.text.config(undo=False, yscrollcommand=self.on_text_scroll)
+        self.scrollbar.config(command=self.yview)
+        self.load_window(0)
+    
+    def close(self):
+        self.index.close()
+        self.mm.close()
+        self.file.close()
+        self.text.config(state=tk.NORMAL, undo=True, yscrollcommand=self.yscrollcommand)
+        self.scrollbar.config(command=self.text.yview)
+        self.text.delete(1.0, tk.END)
+        self.text.edit_reset()
+        self.text.edit_modified(False)
+    
+    def load_window(self, first):
+        first = max(0, min(first, self.index.line_count - self.window_lines))
+        lines = self.index.read_lines(first, self.window_lines, self.encoding)
+        if lines is None:
+            return False
+        self.moving = True
+        try:
+            self.text.config(state=tk.NORMAL)
+            self.text.delete(1.0, tk.END)
+            self.text.insert(1.0, '\n'.join(lines))
+            self.text.config(state=tk.DISABLED)
+            self.text.edit_modified(False)
+        finally:
+            self.moving = False
+        self.window_start = first
+        self.window_count = len(lines)
+        return True
+    
+    def local_line(self, y):
+        return int(self.text.index(f'@0,{y}').split('.')[0]) - 1
+    
+    def global_line(self, index):
+        return self.window_start + int(str(self.text.index(index)).split('.')[0])
+    
+    def show_line(self, line):
+        # Put global line number `line` (0-based) at the top of the view
+        if not self.window_start + self.margin <= line < self.window_start + self.window_count - self.margin:
+            if not self.load_window(line - self.window_lines // 2):
+                return
+        self.moving = True
+        try:
+            self.text.yview(f'{line - self.window_start + 1}.0')
+        finally:
+            self.moving = False
+        self.update_scrollbar()
+    
+    def yview(self, *args):
+        if args[0] == 'moveto':
+            target = int(float(args[1]) * self.index.line_count)
+            target = min(target, self.index.line_count - 1)
+            # Lines past the indexed part cannot be located yet
+            while self.index.line_offset(max(target, 0)) is None:
+                target = self.index.block_lines[-1]
+            self.show_line(max(target, 0))
+        else:
+            self.text.yview(*args)
+    
+    def on_text_scroll(self, first, last):
+        if self.on_scroll:
+            self.on_scroll()
+        if self.moving:
+            return
+        top = self.local_line(0)
+        bottom = self.local_line(self.text.winfo_height())
+        more_below = self.window_start + self.window_count < self.index.line_count
+        if (top < self.margin and self.window_start > 0) or \
+                (bottom > self.window_count - self.margin and more_below):
+            self.show_line(self.window_start + top)
+        else:
+            self.update_scrollbar()
+    
+    def update_scrollbar(self):
+        total = max(self.index.line_count, 1)
+        top = self.window_start + self.local_line(0)
+        bottom = self.window_start + self.local_line(self.text.winfo_height()) + 1
+        self.scrollbar.set(top / total, min(bottom / total, 1.0))
+
+
+class LineGutter:
+    # Line numbers and bookmark dots beside a Text widget. Only the lines on
+    # screen are drawn, and redraw requests (scrolling, edits, resizes) are
+    # coalesced into at most one redraw per frame. number maps a widget line
+    # to the line number shown, for views that hold part of a file.
+    def __init__(self, root, parent, text, bookmarks, number=None, frame_ms=16):
+        self.root = root
+        self.text = text
+        self.bookmarks = bookmarks
+        self.number = number or (lambda line: line)
+        self.frame_ms = frame_ms
+        self.show_numbers = True
+        self.fg = '#858585'
+        self.mark_color = '#1e90ff'
+        self.pending = None
+        self.width = None
+        self.font_spec = None
+        self.font = None
+        self.canvas = tk.Canvas(parent, width=16, highlightthickness=0, bd=0)
+        self.canvas.pack(side=tk.LEFT, fill=tk.Y)
+        text.bind('<Configure>', lambda e: self.schedule(), add='+')
+    
+    def set_colors(self, bg, fg):
+        self.canvas.config(bg=bg)
+        self.fg = fg
+        self.schedule()
+    
+    def set_show_numbers(self, show):
+        self.show_numbers = show
+        self.schedule()
+    
+    def schedule(self):
+        if self.pending is None:
+            self.pending = self.root.after(self.frame_ms, self.redraw)
+    
+    def close(self):
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+            self.pending = None
+    
+    def redraw(self):
+        self.pending = None
+        text = self.text
+        if str(text.cget('font')) != self.font_spec:
+            self.font_spec = str(text.cget('font'))
+            self.font = tkfont.Font(font=self.font_spec)
+        font = self.font
+        dot = font.metrics('linespace') // 3
+        last = int(text.index('end-1c').split('.')[0])
+        digits = len(str(self.number(last))) if self.show_numbers else 0
+        width = dot * 2 + 6 + (font.measure('0' * max(digits, 2)) + 6 if digits else 0)
+        if width != self.width:
+            self.width = width
+            self.canvas.config(width=width)
+        
+        marked = {int(text.index(name).split('.')[0]) for name in self.bookmarks}
+        self.canvas.delete('all')
+        # The top line may be wrapped with its start scrolled out of view
+        index = text.index('@0,0')
+        top = line = int(index.split('.')[0])
+        while line <= last:
+            info = text.dlineinfo(index if line == top else f'{line}.0')
+            if info is None:
+                break
+            y, height = info[1], info[3]
+            if line in marked:
+                middle = y + height // 2
+                self.canvas.create_oval(3, middle - dot // 2 - 1, 3 + dot + 2, middle + dot // 2 + 1,
+                                        fill=self.mark_color, outline='')
+            if digits:
+                self.canvas.create_text(width - 4, y, anchor=tk.NE, text=str(self.number(line)),
+                                        font=font, fill=self.fg)
+            line += 1
+
+
+# Token type -> (light theme, dark theme) foreground
+SYNTAX_COLORS = {
+    'keyword': ('#0000cc', '#569cd6'),
+    'string': ('#a31515', '#ce9178'),
+    'comment': ('#008000', '#6a9955'),
+    'number': ('#098658', '#b5cea8'),
+    'function': ('#795e26', '#dcdcaa'),
+    'decorator': ('#af00db', '#c586c0'),
+    'key': ('#0451a5', '#9cdcfe'),
+    'heading': ('#0000cc', '#569cd6'),
+    'code': ('#a31515', '#ce9178'),
+    'emphasis': ('#af00db', '#c586c0'),
+    'link': ('#0451a5', '#9cdcfe'),
+    'timestamp': ('#098658', '#b5cea8'),
+    'error': ('#d00000', '#f44747'),
+    'warning': ('#b36b00', '#d7ba7d'),
+    'info': ('#0451a5', '#9cdcfe'),
+    'debug': ('#808080', '#808080'),
+}
+MAX_HIGHLIGHT_LINE = 20000
+
+
+class SyntaxHighlighter:
+    # Lexes on a worker thread and colors only what is on screen. states[i]
+    # is the lexer state at the start of line i + 1, and states up to known
+    # have been computed. After an edit a worker re-lexes a snapshot of the
+    # document from the first changed line (dirty) until the state at a line
+    # start past the edit matches the saved one again, then carries on from
+    # known if the first pass had not finished. Painting re-lexes just the
+    # visible lines plus margin from their saved states, so no tokens are
+    # kept for the rest of a large file.
+    UNLEXED = object()
+    
+    def __init__(self, root, text, hook, document, margin=100, batch_lines=5000, frame_ms=16):
+        self.root = root
+        self.text = text
+        self.document = document
+        self.margin = margin
+        self.batch_lines = batch_lines
+        self.frame_ms = frame_ms
+        self.lexer = None
+        self.states = []
+        self.known = 0
+        self.dirty = None
+        self.changed_to = -1
+        self.painted = set()
+        self.generation = 0
+        self.results = queue.Queue()
+        self.pending = None
+        self.paint_pending = None
+        self.polling = False
+        self.running = False
+        hook.listeners.append(self.on_change)
+    
+    def set_lexer(self, lexer):
+        if lexer is self.lexer and lexer is not None:
+            return
+        self.lexer = lexer
+        self.generation += 1
+        for kind in SYNTAX_COLORS:
+            self.text.tag_remove(f'syntax:{kind}', '1.0', tk.END)
+        self.painted.clear()
+        self.states = [None] + [self.UNLEXED] * (self.document.line_count - 1)
+        self.known = 0
+        self.dirty = 0 if lexer else None
+        self.changed_to = -1
+        if lexer:
+            self.schedule()
+    
+    def close(self):
+        self.lexer = None
+        self.generation += 1
+        for pending in (self.pending, self.paint_pending):
+            if pending is not None:
+                self.root.after_cancel(pending)
+        self.pending = self.paint_pending = None
+    
+    def on_change(self, change):
+        if self.lexer is None:
+            return
+        # Old lines first..old_last became first..new_last. The state at the
+        # start of the line after them is kept to compare against.
+        i, j = change.first_line - 1, change.old_last
+        count = change.new_last - change.first_line + 1
+        self.states[i + 1:j] = [self.UNLEXED] * (count - 1)
+        delta = change.new_last - change.old_last
+        if self.known >= j:
+            self.known += delta
+        elif self.known > i:
+            self.known = i
+        if self.changed_to >= j:
+            self.changed_to += delta
+        elif self.changed_to >= i:
+            self.changed_to = i + count - 1
+        self.changed_to = max(self.changed_to, i + count - 1)
+        self.painted = shift_lines(self.painted, change)
+        self.dirty = i if self.dirty is None else min(self.dirty, i)
+        self.generation += 1
+        self.schedule()
+    
+    def schedule(self, delay=50):
+        # Edits arrive in bursts (typing, streaming a file in), so wait for a pause
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+        self.pending = self.root.after(delay, self.start)
+    
+    def start(self):
+        self.pending = None
+        if self.lexer is None or self.dirty is None:
+            return
+        job = self.generation
+        thread = threading.Thread(target=self.lex, daemon=True,
+                                  args=(job, self.lexer, self.document.copy(), self.dirty,
+                                        self.states[self.dirty], self.changed_to, self.known))
+        thread.start()
+        self.running = True
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.frame_ms, self.poll)
+    
+    def lex(self, job, lexer, document, first, state, changed_to, known):
+        # Worker thread. Reads the shared states list only to find where the
+        # new states meet the old ones; results of a job overtaken by an
+        # edit are dropped by poll(), so a stale read does no harm.
+        batch = []
+        start = first
+        try:
+            for line, text in enumerate(document.iter_lines(first + 1), first):
+                if job != self.generation:
+                    return
+                state = lexer.lex(text, state)[1]
+                batch.append(state)
+                if line >= changed_to and line < known and self.states[line + 1] == state:
+                    break
+                if len(batch) >= self.batch_lines:
+                    self.results.put((job, start, batch, False))
+                    start += len(batch)
+                    batch = []
+        except IndexError:
+            return
+        self.results.put((job, start, batch, True))
+    
+    def poll(self):
+        while True:
+            try:
+                job, first, batch, done = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if job != self.generation:
+                continue
+            for offset, state in enumerate(batch, first + 1):
+                # state is the state at the start of line offset + 1
+                if offset < len(self.states) and self.states[offset] != state:
+                    self.states[offset] = state
+                    self.painted.discard(offset + 1)
+            self.known = min(max(self.known, first + len(batch)), len(self.states) - 1)
+            if done:
+                # An edit may have cut the first pass short; carry on from known
+                self.running = False
+                self.dirty = self.known if self.known < len(self.states) - 1 else None
+                self.changed_to = -1
+                if self.dirty is not None:
+                    self.schedule(0)
+            else:
+                self.dirty = first + len(batch)
+            self.schedule_paint()
+        if self.running and self.lexer is not None:
+            self.root.after(self.frame_ms, self.poll)
+        else:
+            self.polling = False
+    
+    def schedule_paint(self):
+        if self.paint_pending is None:
+            self.paint_pending = self.root.after(self.frame_ms, self.paint)
+    
+    def paint(self):
+        self.paint_pending = None
+        if self.lexer is None:
+            return
+        text = self.text
+        top = int(text.index('@0,0').split('.')[0])
+        bottom = int(text.index(f'@0,{text.winfo_height()}').split('.')[0])
+        first = max(1, top - self.margin)
+        last = min(len(self.states), bottom + self.margin)
+        lines = [line for line in range(first, last + 1)
+                 if line not in self.painted and self.states[line - 1] is not self.UNLEXED]
+        if not lines:
+            return
+        
+        first, last = lines[0], lines[-1]
+        contents = str(text.get(f'{first}.0', f'{last}.end')).split('\n')
+        spans = {}
+        for line in lines:
+            content = contents[line - first]
+            if len(content) > MAX_HIGHLIGHT_LINE:
+                continue
+            for start, end, kind in self.lexer.lex(content, self.states[line - 1])[0]:
+                spans.setdefault(kind, []).append((f'{line}.{start}', f'{line}.{end}'))
+        # Clear each run of consecutive lines with one call per tag
+        runs = []
+        for line in lines:
+            if runs and runs[-1][1] == line - 1:
+                runs[-1][1] = line
+            else:
+                runs.append([line, line])
+        for kind in SYNTAX_COLORS:
+            for run_first, run_last in runs:
+                text.tag_remove(f'syntax:{kind}', f'{run_first}.0', f'{run_last}.end')
+        for kind, kind_spans in spans.items():
+            tag_spans(text, f'syntax:{kind}', kind_spans)
+        self.painted.update(lines)
+
+
+def format_status(text, stats, large_view=None):
+    # The insert mark's index and the incremental word count are both cheap
+    line, col = text.index(tk.INSERT).split('.')
+    if large_view:
+        line = large_view.global_line(tk.INSERT)
+        index = large_view.index
+        lines = f"{index.line_count:,} lines" if index.done else \
+            f"~{index.line_count:,} lines (indexing {index.indexed * 100 // index.size}%)"
+        return f"Line: {line} | Col: {col} | {lines} | Large file, read-only"
+    return f"Line: {line} | Col: {col} | Words: {stats.words}"
+
+
+class StatusScheduler:
+    # Status labels are refreshed at most once per frame: mark() only flags
+    # a label as stale, and the flush recomputes the stale ones and
+    # reconfigures those whose text changed. compute() returning None
+    # leaves its label alone.
+    def __init__(self, root, frame_ms=16):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.labels = {}
+        self.dirty = set()
+        self.job = None
+        self.last_flush = 0.0
+        self.requests = 0
+        self.flushes = 0
+        self.updates = 0
+    
+    def add(self, name, label, compute):
+        self.labels[name] = (label, compute)
+    
+    def mark(self, name):
+        self.requests += 1
+        self.dirty.add(name)
+        if self.job is None:
+            wait = int(self.frame_ms - (time.perf_counter() - self.last_flush) * 1000)
+            self.job = self.root.after(wait, self.flush) if wait > 0 else self.root.after_idle(self.flush)
+    
+    def flush(self):
+        # Also callable directly, which drops the scheduled flush
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+        self.last_flush = time.perf_counter()
+        self.flushes += 1
+        dirty, self.dirty = self.dirty, set()
+        for name in dirty:
+            label, compute = self.labels[name]
+            text = compute()
+            if text is not None and text != label.cget('text'):
+                label.config(text=text)
+                self.updates += 1
+    
+    def counts(self):
+        return {'requests': self.requests, 'coalesced': self.requests - self.flushes,
+                'flushes': self.flushes, 'label updates': self.updates}
+
+
+class LatencyHUD:
+    # Overlay in the top right corner of the window listing the slowest
+    # handlers and event-loop stalls, refreshed while shown
+    def __init__(self, root, profiler, rows=8, refresh_ms=500):
+        self.root = root
+        self.profiler = profiler
+        self.rows = rows
+        self.refresh_ms = refresh_ms
+        self.label = tk.Label(root, justify=tk.LEFT, anchor=tk.NW, font=('Consolas', 9),
+                              bg='#202020', fg='#e0e0e0', padx=6, pady=4)
+        self.pending = None
+    
+    @property
+    def shown(self):
+        return self.pending is not None
+    
+    def toggle(self):
+        if self.shown:
+            self.root.after_cancel(self.pending)
+            self.pending = None
+            self.label.place_forget()
+        else:
+            self.label.place(relx=1.0, y=40, anchor=tk.NE)
+            self.refresh()
+    
+    def refresh(self):
+        rows, stalls = self.profiler.summary()
+        lines = [f"{'handler':<28}{'calls':>7}{'p50':>8}{'p99':>8}"]
+        for row in rows[:self.rows]:
+            lines.append(f"{row['handler'][-28:]:<28}{row['calls']:>7}"
+                         f"{row['p50_ms']:>6.1f}ms{row['p99_ms']:>6.1f}ms")
+        lines.append(f"stalls p99 {stalls['p99_ms']:.0f} ms, max {stalls['max_ms']:.0f} ms, "
+                     f"{stalls['over_100ms']} over 100 ms")
+        for name, counts in self.profiler.counters.items():
+            lines.append(f"{name}: " + ', '.join(f"{value} {key}" for key, value in counts().items()))
+        self.label.config(text='\n'.join(lines))
+        self.label.lift()
+        self.pending = self.root.after(self.refresh_ms, self.refresh)
+
+
+class EditorTab:
+    # One open document. A background tab without undo history can drop its
+    # Text widget; the text, cursor, scroll position and bookmarks are kept
+    # until the tab is shown again. content is None for a session tab whose
+    # file has not been read yet; loaded stays False until that read finishes.
+    # bookmarks maps Tk mark names to the index saved while the widget is dropped.
+    def __init__(self, frame, journal):
+        self.frame = frame
+        self.journal = journal
+        self.text = None
+        self.v_scrollbar = None
+        self.gutter = None
+        self.highlighter = None
+        self.edit_hook = None
+        self.document = None
+        self.text_stats = None
+        self.find_engine = None
+        self.current_file = None
+        self.file_encoding = 'utf-8'
+        self.line_ending = os.linesep
+        self.modified = False
+        self.loader = None
+        self.saver = None
+        self.large_view = None
+        self.transform_job = None
+        self.remember_loaded = True
+        self.goto_line = None
+        self.restore_view = None
+        self.bookmarks = {}
+        self.find_index = '1.0'
+        self.title = "Enhanced Notepad Pro - New File"
+        self.content = ''
+        self.loaded = True
+        self.cursor = '1.0'
+        self.yview = 0.0
+    
+    @property
+    def name(self):
+        file_path = self.current_file or (self.loader and self.loader.file_path)
+        return os.path.basename(file_path) if file_path else "New File"
+    
+    def is_blank(self):
+        # An untouched untitled tab is reused by Open
+        return (not self.current_file and not self.modified and not self.loader and not self.large_view
+                and (self.text.compare('end-1c', '==', '1.0') if self.text else not self.content))
+
+
+def tab_attribute(name):
+    # Per-document state lives on the selected EditorTab
+    return property(lambda self: getattr(self.tab, name),
+                    lambda self, value: setattr(self.tab, name, value))
 
-# Initialize spell checker and text-to-speech
-spell = SpellChecker()
-spell.word_frequency.load_words(['mera', 'naam', 'ahsan', 'kaise', 'ho'])
-engine = pyttsx3.init()
 
 class EnhancedNotepadPro:
-    def __init__(self, root):
+    text_area = tab_attribute('text')
+    v_scrollbar = tab_attribute('v_scrollbar')
+    edit_hook = tab_attribute('edit_hook')
+    document = tab_attribute('document')
+    text_stats = tab_attribute('text_stats')
+    find_engine = tab_attribute('find_engine')
+    journal = tab_attribute('journal')
+    current_file = tab_attribute('current_file')
+    file_encoding = tab_attribute('file_encoding')
+    modified = tab_attribute('modified')
+    loader = tab_attribute('loader')
+    saver = tab_attribute('saver')
+    line_ending = tab_attribute('line_ending')
+    large_view = tab_attribute('large_view')
+    bookmarks = tab_attribute('bookmarks')
+    find_index = tab_attribute('find_index')
+    
+    def __init__(self, root, profiler=None):
         self.root = root
+        self.profiler = profiler
+        if profiler:
+            profiler.instrument(self, 'app')
         self.root.title("📝 Enhanced Notepad Pro")
         self.root.geometry("1000x700")
         
-        self.current_file = None
         self.dark_mode = False
         self.font_size = 14
         self.font_family = "Consolas"
         self.recent_files = []
         self.max_recent = 10
-        self.config_file = "notepad_config.json"
-        self.bookmarks = {}
-        self.find_index = '1.0'
+        self.config_file = os.path.join(user_config_dir(), 'settings.json')
         self.show_line_numbers = True
-        self.modified = False
+        self.large_file_threshold = LARGE_FILE_THRESHOLD
+        self.live_spell = False
+        self.live_grammar = False
+        self.suggestion_cache_size = 2000
+        self.speech_rate = 200
+        self.open_files = []
+        self.active_tab = 0
+        self.max_live_tabs = 4
+        self.tabs = []
+        self.tab = None
+        self.shown_tabs = []
+        self.tab_count = 0
+        self.find_key = None
+        self.speech_tab = None
+        self.bookmark_count = 0
+        self.search_folders = []
+        self.search_pattern = '*.txt;*.md'
+        self.index_thread = None
+        self.index_again = False
+        self.index_error = None
+        self.files_status = None
+        self.recent_info = {}
+        self.recent_check = None
+        
+        # Settings and per-file view state are written in the background,
+        # coalesced, and atomically
+        self.autosaver = AutoSaver()
+        self.settings = SettingsStore(self.root, self.config_file, self.collect_settings, self.autosaver)
+        self.file_state_store = SettingsStore(self.root, os.path.join(user_data_dir(), 'file_state.json'),
+                                              lambda: self.file_states, self.autosaver, delay=3000)
         
         # Load settings
         self.load_settings()
+        self.suggestions = SuggestionService(
+            os.path.join(os.path.dirname(os.path.abspath(self.config_file)), 'notepad_suggestions.json'),
+            maxsize=self.suggestion_cache_size)
+        startup.mark("load settings")
+        
+        # Crash recovery: every tab journals its edits under this session
+        self.recovery_dir = os.path.join(user_data_dir(), 'recovery')
+        self.session = f'{os.getpid()}-{int(time.time())}'
         
         # Create UI
         self.create_menu()
         self.create_toolbar()
-        self.create_text_area()
         self.create_status_bar()
+        self.create_text_area()
+        self.restore_tabs()
+        startup.mark("create UI")
         
         # Bind shortcuts
         self.bind_shortcuts()
         
-        # Track changes
-        self.text_area.bind('<KeyRelease>', self.update_status)
-        self.text_area.bind('<ButtonRelease>', self.update_status)
-        self.text_area.bind('<<Modified>>', self.on_modified)
+        self.speech = SpeechPipeline(self.root, self.on_speech_event, rate=self.speech_rate)
+        if self.live_spell:
+            self.live_speller.enable()
+        if self.live_grammar:
+            self.live_grammar_checker.enable()
+        
+        self.flush_journal()
+        self.root.after_idle(self.offer_recovery)
         
         # Auto-save
         self.auto_save_interval = 180000  # 3 minutes
         self.schedule_auto_save()
         
-        # Apply theme
-        self.apply_theme()
+        startup.mark("bind events, theme")
+        
+        # Load the dictionary in the background once the window is up
+        self.root.after_idle(self.warm_up_engines)
+        
+        # Find in Files index, brought up to date in the background
+        self.search_index = SearchIndex(os.path.join(user_data_dir(), 'search_index.sqlite3'))
+        self.root.after_idle(self.start_indexing)
+        self.root.after_idle(self.check_recent_files)
+        
+        if profiler:
+            self.hud = LatencyHUD(self.root, profiler)
+            self.root.bind('<F12>', lambda e: self.hud.toggle())
+            profiler.start_heartbeat(self.root)
+        
+    def warm_up_engines(self):
+        startup.mark("first paint")
+        
+        def warm():
+            get_spell_checker()
+            startup.mark("spell checker ready (background)")
+            engines_warm.set()
+        
+        threading.Thread(target=warm, daemon=True).start()
+    
+    def flush_journal(self):
+        for tab in self.tabs:
+            tab.journal.flush()
+        self.root.after(1000, self.flush_journal)
+    
+    def offer_recovery(self):
+        for session, state in RecoveryJournal.stale_sessions(self.recovery_dir):
+            try:
+                base, ops = RecoveryJournal.load(self.recovery_dir, session, state)
+            except (OSError, RecoveryError) as e:
+                messagebox.showwarning("Recovery", f"Could not recover unsaved changes: {str(e)}")
+                RecoveryJournal.remove_files(self.recovery_dir, session)
+                continue
+            if not ops and not state['snapshot']:
+                RecoveryJournal.remove_files(self.recovery_dir, session)
+                continue
+            
+            name = os.path.basename(state['path']) if state['path'] else "an untitled document"
+            if messagebox.askyesno("Recovery", f"Enhanced Notepad Pro did not close cleanly.\n\n"
+                                               f"Recover unsaved changes to {name}?"):
+                self.recover_session(state, base, ops)
+            RecoveryJournal.remove_files(self.recovery_dir, session)
+    
+    def recover_session(self, state, base, ops):
+        tab = self.open_tab(state['path'])
+        self.cancel_loading(tab)
+        tab.journal.stop()
+        text = tab.text
+        text.delete(1.0, tk.END)
+        if state['path']:
+            # The file on disk is the base of this session's journal too
+            text.insert(1.0, base)
+            tab.journal.start(state['path'], state['encoding'])
+        else:
+            tab.journal.start(None, state['encoding'])
+            text.insert(1.0, base)
+        for op, start, end, inserted in ops:
+            if op == 'insert':
+                text.insert(start, inserted)
+            elif op == 'delete':
+                text.delete(start, end)
+            else:
+                text.replace(start, end, inserted)
         
+        text.edit_reset()
+        tab.current_file = state['path']
+        tab.file_encoding = state['encoding']
+        self.update_highlighter(tab)
+        tab.modified = True
+        self.status.mark('modified')
+        self.set_title(tab, f"Enhanced Notepad Pro - {tab.name} (recovered)")
+    
     def create_menu(self):
         menubar = tk.Menu(self.root)
         self.root.config(menu=menubar)
@@ -65,10 +2559,26 @@ class EnhancedNotepadPro:
         file_menu.add_command(label="Open", command=self.open_file, accelerator="Ctrl+O")
         file_menu.add_command(label="Save", command=self.save_file, accelerator="Ctrl+S")
         file_menu.add_command(label="Save As", command=self.save_as_file)
+        
+        # Both apply to the next save of the current tab
+        self.encoding_var = tk.StringVar()
+        self.line_ending_var = tk.StringVar()
+        encoding_menu = tk.Menu(file_menu, tearoff=0, postcommand=self.sync_save_format)
+        for encoding in SAVE_ENCODINGS:
+            encoding_menu.add_radiobutton(label=encoding, value=encoding, variable=self.encoding_var,
+                                          command=self.set_save_format)
+        file_menu.add_cascade(label="Encoding", menu=encoding_menu)
+        line_ending_menu = tk.Menu(file_menu, tearoff=0, postcommand=self.sync_save_format)
+        for label, line_ending in LINE_ENDINGS:
+            line_ending_menu.add_radiobutton(label=label, value=line_ending, variable=self.line_ending_var,
+                                             command=self.set_save_format)
+        file_menu.add_cascade(label="Line Endings", menu=line_ending_menu)
+        file_menu.add_command(label="Close Tab", command=self.close_tab, accelerator="Ctrl+W")
         file_menu.add_separator()
         
-        self.recent_menu = tk.Menu(file_menu, tearoff=0)
+        self.recent_menu = tk.Menu(file_menu, tearoff=0, postcommand=self.check_recent_files)
         file_menu.add_cascade(label="Recent Files", menu=self.recent_menu)
+        file_menu.add_command(label="Open All Recent Files", command=self.open_all_recent)
         self.update_recent_menu()
         
         file_menu.add_separator()
@@ -86,9 +2596,18 @@ class EnhancedNotepadPro:
         edit_menu.add_command(label="Select All", command=self.select_all, accelerator="Ctrl+A")
         edit_menu.add_separator()
         edit_menu.add_command(label="Find", command=self.find_text, accelerator="Ctrl+F")
+        edit_menu.add_command(label="Find Next", command=self.find_next, accelerator="F3")
+        edit_menu.add_command(label="Find Previous", command=lambda: self.find_next(backwards=True),
+                              accelerator="Shift+F3")
         edit_menu.add_command(label="Replace", command=self.replace_text, accelerator="Ctrl+H")
+        edit_menu.add_command(label="Find in Files", command=self.find_in_files, accelerator="Ctrl+Shift+F")
         edit_menu.add_separator()
         edit_menu.add_command(label="Insert Date/Time", command=self.insert_datetime, accelerator="F5")
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Toggle Bookmark", command=self.toggle_bookmark, accelerator="Ctrl+F2")
+        edit_menu.add_command(label="Next Bookmark", command=self.next_bookmark, accelerator="F2")
+        edit_menu.add_command(label="Previous Bookmark", command=lambda: self.next_bookmark(backwards=True),
+                              accelerator="Shift+F2")
         
         # Format Menu
         format_menu = tk.Menu(menubar, tearoff=0)
@@ -97,15 +2616,29 @@ class EnhancedNotepadPro:
         format_menu.add_command(label="Increase Font", command=self.increase_font, accelerator="Ctrl++")
         format_menu.add_command(label="Decrease Font", command=self.decrease_font, accelerator="Ctrl+-")
         format_menu.add_separator()
+        self.show_line_numbers_var = tk.BooleanVar(value=self.show_line_numbers)
+        format_menu.add_checkbutton(label="Line Numbers", variable=self.show_line_numbers_var,
+                                    command=self.toggle_line_numbers)
         format_menu.add_command(label="Dark Mode", command=self.toggle_dark_mode, accelerator="Ctrl+D")
         
         # Tools Menu
         tools_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Tools", menu=tools_menu)
         tools_menu.add_command(label="Spell Check", command=self.check_spelling)
+        self.live_spell_var = tk.BooleanVar(value=self.live_spell)
+        tools_menu.add_checkbutton(label="Live Spell Check", variable=self.live_spell_var,
+                                   command=self.toggle_live_spell)
+        tools_menu.add_command(label="Suggestion Cache Stats", command=self.show_suggestion_stats)
         tools_menu.add_command(label="Grammar Check", command=self.grammar_check)
+        self.live_grammar_var = tk.BooleanVar(value=self.live_grammar)
+        tools_menu.add_checkbutton(label="Live Grammar Check", variable=self.live_grammar_var,
+                                   command=self.toggle_live_grammar)
+        tools_menu.add_command(label="Grammar Rule Timings", command=self.show_grammar_timings)
         tools_menu.add_separator()
         tools_menu.add_command(label="Speak Text", command=self.speak_text)
+        tools_menu.add_command(label="Pause/Resume Speech", command=self.pause_speech)
+        tools_menu.add_command(label="Skip Sentence", command=self.skip_sentence)
+        tools_menu.add_command(label="Stop Speech", command=self.stop_speech)
         tools_menu.add_command(label="Voice Settings", command=self.configure_voice)
         tools_menu.add_separator()
         tools_menu.add_command(label="Word Count", command=self.show_word_count)
@@ -113,12 +2646,24 @@ class EnhancedNotepadPro:
         tools_menu.add_command(label="UPPERCASE", command=self.to_uppercase)
         tools_menu.add_command(label="lowercase", command=self.to_lowercase)
         tools_menu.add_command(label="Title Case", command=self.to_titlecase)
+        tools_menu.add_separator()
+        tools_menu.add_command(label="Sort Lines", command=lambda: self.run_transform('sort'))
+        tools_menu.add_command(label="Remove Duplicate Lines", command=lambda: self.run_transform('dedupe'))
+        tools_menu.add_command(label="Trim Trailing Whitespace", command=lambda: self.run_transform('trim'))
         
         # Help Menu
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Help", menu=help_menu)
         help_menu.add_command(label="Shortcuts", command=self.show_shortcuts)
         help_menu.add_command(label="About", command=self.show_about)
+        if self.profiler:
+            help_menu.add_separator()
+            help_menu.add_command(label="Latency HUD", command=lambda: self.hud.toggle(), accelerator="F12")
+            help_menu.add_command(label="Export Handler Timings...", command=self.export_timings)
+            self.cprofile_var = tk.BooleanVar(value=False)
+            help_menu.add_checkbutton(label="Record cProfile", variable=self.cprofile_var,
+                                      command=lambda: self.profiler.record_cprofile(self.cprofile_var.get()))
+            help_menu.add_command(label="Save cProfile Dump...", command=self.save_cprofile)
         
     def create_toolbar(self):
         self.toolbar = tk.Frame(self.root, bd=2, relief=tk.GROOVE, bg='#f0f0f0')
@@ -150,27 +2695,241 @@ class EnhancedNotepadPro:
         
         tk.Button(self.toolbar, text="Spell Check", command=self.check_spelling, **btn_style).pack(side=tk.LEFT, padx=2)
         tk.Button(self.toolbar, text="Speak", command=self.speak_text, **btn_style).pack(side=tk.LEFT, padx=2)
+        tk.Button(self.toolbar, text="Stop", command=self.stop_speech, **btn_style).pack(side=tk.LEFT, padx=2)
         
     def create_text_area(self):
-        text_frame = tk.Frame(self.root)
-        text_frame.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
+        self.notebook.enable_traversal()
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        
+        # One live spell and grammar checker for all tabs, attached to the visible one
+        self.live_speller = LiveSpellChecker(self.root)
+        self.grammar = GrammarChecker()
+        self.live_grammar_checker = LiveGrammarChecker(self.root, self.grammar)
+        if self.profiler:
+            self.profiler.instrument(self.live_speller, 'LiveSpellChecker')
+            self.profiler.instrument(self.live_grammar_checker, 'LiveGrammarChecker')
+    
+    def new_tab(self, file_path=None):
+        self.tab_count += 1
+        frame = tk.Frame(self.notebook)
+        tab = EditorTab(frame, RecoveryJournal(self.recovery_dir, f'{self.session}-{self.tab_count}'))
+        if file_path:
+            # Read from disk when the tab is first shown
+            tab.current_file = file_path
+            tab.content = None
+            tab.loaded = False
+            tab.title = f"Enhanced Notepad Pro - {tab.name}"
+        self.tabs.append(tab)
+        self.notebook.add(frame, text=tab.name)
+        return tab
+    
+    def open_tab(self, file_path=None):
+        # The tab showing file_path, else the current tab if blank, else a new tab
+        for tab in self.tabs:
+            if file_path and file_path in (tab.current_file, tab.loader and tab.loader.file_path):
+                break
+        else:
+            tab = self.tab if self.tab is not None and self.tab.is_blank() else self.new_tab()
+        self.select_tab(tab)
+        return tab
+    
+    def on_tab_changed(self, event=None):
+        selected = str(self.notebook.select())
+        for tab in self.tabs:
+            if str(tab.frame) == selected:
+                self.select_tab(tab)
+    
+    def select_tab(self, tab):
+        if str(self.notebook.select()) != str(tab.frame):
+            self.notebook.select(tab.frame)
+        if tab is self.tab:
+            return
+        self.tab = tab
+        if tab in self.shown_tabs:
+            self.shown_tabs.remove(tab)
+        self.shown_tabs.append(tab)
+        if tab.text is None:
+            self.materialize(tab)
+        loading = lambda: tab.loader is not None
+        self.live_speller.attach(tab.text, tab.edit_hook, loading)
+        self.live_grammar_checker.attach(tab.text, tab.edit_hook, loading)
+        
+        self.root.title(tab.title)
+        self.status.mark('modified')
+        if tab.loader:
+            self.cancel_button.pack(side=tk.RIGHT)
+        else:
+            self.cancel_button.pack_forget()
+        tab.text.focus_set()
+        self.update_status()
+        self.root.after_idle(self.drop_hidden_tabs)
+    
+    def materialize(self, tab):
+        tab.v_scrollbar = tk.Scrollbar(tab.frame)
+        tab.v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        gutter_frame = tk.Frame(tab.frame)
+        gutter_frame.pack(side=tk.LEFT, fill=tk.Y)
         
-        v_scrollbar = tk.Scrollbar(text_frame)
-        v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tab.text = tk.Text(tab.frame, wrap=tk.WORD, 
+                           font=(self.font_family, self.font_size),
+                           undo=True, maxundo=-1,
+                           yscrollcommand=lambda first, last: self.on_text_scroll(tab, first, last),
+                           relief=tk.FLAT,
+                           padx=10, pady=10)
+        tab.text.pack(expand=True, fill=tk.BOTH)
         
-        self.text_area = tk.Text(text_frame, wrap=tk.WORD, 
-                                font=(self.font_family, self.font_size),
-                                undo=True, maxundo=-1,
-                                yscrollcommand=v_scrollbar.set,
-                                relief=tk.FLAT,
-                                padx=10, pady=10)
-        self.text_area.pack(expand=True, fill=tk.BOTH)
+        tab.v_scrollbar.config(command=tab.text.yview)
+        tab.gutter = LineGutter(self.root, gutter_frame, tab.text, tab.bookmarks,
+                                number=lambda line: tab.large_view.window_start + line if tab.large_view else line)
+        tab.gutter.show_numbers = self.show_line_numbers
+        tab.gutter.canvas.bind('<Button-1>', lambda e: self.toggle_bookmark(tab.text.index(f'@0,{e.y}')))
         
-        v_scrollbar.config(command=self.text_area.yview)
+        # Incremental statistics fed by the widget's insert/delete path
+        tab.edit_hook = TextEditHook(tab.text)
+        tab.document = PieceTable()
+        tab.edit_hook.listeners.append(tab.document.on_change)
+        tab.text_stats = TextStats(tab.edit_hook)
+        tab.find_engine = FindEngine(tab.edit_hook)
+        tab.highlighter = SyntaxHighlighter(self.root, tab.text, tab.edit_hook, tab.document)
         
-        self.text_area.tag_configure('found', background='yellow', foreground='black')
-        self.text_area.tag_configure('misspelled', foreground='red', underline=True)
+        tab.text.tag_configure('found', background='yellow', foreground='black')
+        tab.text.tag_configure('misspelled', foreground='red', underline=True)
+        tab.text.tag_configure('grammar', foreground='#b8860b', underline=True)
+        tab.text.tag_configure('speaking', background='#cce5ff', foreground='black')
+        self.style_tab(tab)
         
+        # Track changes
+        tab.text.bind('<KeyRelease>', self.update_status)
+        tab.text.bind('<ButtonRelease>', self.update_status)
+        tab.text.bind('<<Modified>>', lambda e: self.on_modified(tab))
+        tab.text.bind('<Button-3>', self.show_spelling_menu)
+        
+        if tab.content:
+            tab.text.insert(1.0, tab.content)
+            tab.text.edit_reset()
+            tab.text.edit_modified(False)
+            tab.text.mark_set(tk.INSERT, tab.cursor)
+            tab.text.yview_moveto(tab.yview)
+            for name, index in tab.bookmarks.items():
+                tab.text.mark_set(name, index)
+                tab.text.mark_gravity(name, tk.LEFT)
+            self.update_highlighter(tab)
+        tab.edit_hook.listeners.append(tab.journal.record)
+        if tab.content is None:
+            tab.content = ''
+            try:
+                self.read_file(tab, tab.current_file, remember=False)
+            except Exception as e:
+                self.reset_after_load(tab)
+                messagebox.showerror("Error", f"Could not open file: {str(e)}")
+        else:
+            tab.content = ''
+            tab.journal.start(tab.current_file, tab.file_encoding)
+    
+    def dematerialize(self, tab):
+        tab.content = tab.document.text()
+        tab.cursor = tab.text.index(tk.INSERT)
+        tab.yview = tab.text.yview()[0]
+        for name in tab.bookmarks:
+            tab.bookmarks[name] = tab.text.index(name)
+        tab.gutter.close()
+        tab.highlighter.close()
+        tab.journal.stop()
+        for widget in tab.frame.winfo_children():
+            widget.destroy()
+        tab.text = tab.v_scrollbar = tab.gutter = tab.highlighter = tab.edit_hook = tab.document = tab.text_stats = tab.find_engine = None
+    
+    def can_drop(self, tab):
+        # The undo stack only lives in the widget, so tabs with history keep it
+        return not (tab is self.tab or tab is self.speech_tab or tab.modified or tab.loader or tab.saver
+                    or tab.large_view
+                    or tab.transform_job
+                    or tab.text.tk.getboolean(tab.text.edit('canundo'))
+                    or tab.text.tk.getboolean(tab.text.edit('canredo')))
+    
+    def drop_hidden_tabs(self):
+        # Keep at most max_live_tabs Text widgets, dropping the least recently shown first
+        live = [tab for tab in self.shown_tabs if tab.text is not None]
+        for tab in live[:max(0, len(live) - self.max_live_tabs)]:
+            if self.can_drop(tab):
+                self.dematerialize(tab)
+    
+    def close_tab(self, tab=None):
+        tab = tab or self.tab
+        if tab.modified:
+            self.select_tab(tab)
+            response = messagebox.askyesnocancel("Save Changes", f"Save changes to {tab.name}?")
+            if response is None:
+                return
+            if response:
+                self.save_file(wait=True)
+                if tab.modified:
+                    return
+        
+        if tab is self.speech_tab:
+            self.stop_speech()
+        if tab.transform_job:
+            tab.transform_job.cancel()
+        if tab.saver:
+            tab.saver.thread.join()
+            tab.saver = None
+        self.remember_file_state(tab)
+        if tab.loader:
+            tab.loader.cancel()
+            tab.loader = None
+        if tab.large_view:
+            tab.large_view.close()
+            tab.large_view = None
+        if tab.gutter is not None:
+            tab.gutter.close()
+            tab.highlighter.close()
+        tab.journal.stop()
+        self.tabs.remove(tab)
+        if tab in self.shown_tabs:
+            self.shown_tabs.remove(tab)
+        self.notebook.forget(tab.frame)
+        tab.frame.destroy()
+        
+        if tab is self.tab:
+            self.tab = None
+            self.live_speller.attach(None, None)
+            self.live_grammar_checker.attach(None, None)
+            if not self.tabs:
+                self.new_tab()
+            self.select_tab(self.shown_tabs[-1] if self.shown_tabs else self.tabs[0])
+    
+    def restore_tabs(self):
+        # Reopen last session's files as tabs; only the active one is read now
+        tabs = [self.new_tab(path) for path in self.open_files if os.path.isfile(path)]
+        if not tabs:
+            tabs.append(self.new_tab())
+        active = self.open_files[self.active_tab] if 0 <= self.active_tab < len(self.open_files) else None
+        self.select_tab(next((tab for tab in tabs if tab.current_file == active), tabs[0]))
+    
+    def open_all_recent(self):
+        for file_path in self.recent_files:
+            if os.path.isfile(file_path) and not any(tab.current_file == file_path for tab in self.tabs):
+                self.new_tab(file_path)
+    
+    def set_title(self, tab, title):
+        tab.title = title
+        self.update_tab_label(tab)
+        if tab is self.tab:
+            self.root.title(title)
+    
+    def update_tab_label(self, tab):
+        self.notebook.tab(tab.frame, text=f"{tab.name} *" if tab.modified else tab.name)
+    
+    def on_text_scroll(self, tab, first, last):
+        tab.v_scrollbar.set(first, last)
+        tab.gutter.schedule()
+        tab.highlighter.schedule_paint()
+        if tab is self.tab:
+            self.live_speller.on_scroll()
+            self.live_grammar_checker.on_scroll()
+    
     def create_status_bar(self):
         self.status_frame = tk.Frame(self.root, bd=1, relief=tk.SUNKEN)
         self.status_frame.pack(side=tk.BOTTOM, fill=tk.X)
@@ -182,31 +2941,41 @@ class EnhancedNotepadPro:
         self.modified_label = tk.Label(self.status_frame, text="", width=10)
         self.modified_label.pack(side=tk.RIGHT)
         
+        # Only shown while a file is streaming in
+        self.cancel_button = tk.Button(self.status_frame, text="Cancel", relief=tk.FLAT,
+                                       command=self.cancel_loading)
+        
+        # Keys, clicks and edits only mark these; they are redrawn once per frame
+        self.status = StatusScheduler(self.root)
+        self.status.add('status', self.status_bar, self.status_text)
+        self.status.add('modified', self.modified_label, self.modified_text)
+        if self.profiler:
+            self.profiler.instrument(self.status, 'status')
+            self.profiler.counters['status'] = self.status.counts
+        
     def bind_shortcuts(self):
         self.root.bind('<Control-n>', lambda e: self.new_file())
         self.root.bind('<Control-o>', lambda e: self.open_file())
         self.root.bind('<Control-s>', lambda e: self.save_file())
+        self.root.bind('<Control-w>', lambda e: self.close_tab())
         self.root.bind('<Control-f>', lambda e: self.find_text())
         self.root.bind('<Control-h>', lambda e: self.replace_text())
+        self.root.bind('<Control-F>', lambda e: self.find_in_files())
         self.root.bind('<Control-a>', lambda e: self.select_all())
         self.root.bind('<Control-plus>', lambda e: self.increase_font())
         self.root.bind('<Control-minus>', lambda e: self.decrease_font())
         self.root.bind('<Control-d>', lambda e: self.toggle_dark_mode())
         self.root.bind('<F5>', lambda e: self.insert_datetime())
+        self.root.bind('<F3>', lambda e: self.find_next())
+        self.root.bind('<Shift-F3>', lambda e: self.find_next(backwards=True))
+        self.root.bind('<Control-F2>', lambda e: self.toggle_bookmark())
+        self.root.bind('<F2>', lambda e: self.next_bookmark())
+        self.root.bind('<Shift-F2>', lambda e: self.next_bookmark(backwards=True))
+        self.root.bind('<Escape>', lambda e: self.cancel_loading() or self.cancel_transform())
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
     
     def new_file(self):
-        if self.modified:
-            response = messagebox.askyesnocancel("Save Changes", "Do you want to save changes?")
-            if response:
-                self.save_file()
-            elif response is None:
-                return
-        
-        self.text_area.delete(1.0, tk.END)
-        self.current_file = None
-        self.modified = False
-        self.root.title("Enhanced Notepad Pro - New File")
+        self.select_tab(self.new_tab())
         
     def open_file(self):
         file_path = filedialog.askopenfilename(
@@ -215,46 +2984,297 @@ class EnhancedNotepadPro:
         
         if file_path:
             try:
-                with open(file_path, "r", encoding="utf-8") as file:
-                    self.text_area.delete(1.0, tk.END)
-                    self.text_area.insert(tk.END, file.read())
-                self.current_file = file_path
-                self.modified = False
-                self.root.title(f"Enhanced Notepad Pro - {os.path.basename(file_path)}")
-                self.add_to_recent(file_path)
+                self.load_file(file_path)
             except Exception as e:
                 messagebox.showerror("Error", f"Could not open file: {str(e)}")
-            
-    def save_file(self):
-        if self.current_file:
+    
+    def open_paths(self, files):
+        # Files from the command line, or handed over by a later launch
+        for file_path in files:
             try:
-                with open(self.current_file, "w", encoding="utf-8") as file:
-                    file.write(self.text_area.get(1.0, tk.END)[:-1])
-                self.modified = False
-                self.modified_label.config(text="")
-                messagebox.showinfo("Save", "File saved successfully!")
+                self.load_file(file_path)
             except Exception as e:
-                messagebox.showerror("Error", f"Could not save file: {str(e)}")
+                messagebox.showerror("Error", f"Could not open file: {str(e)}")
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+    
+    def load_file(self, file_path, remember=True):
+        encoding = detect_encoding(file_path)
+        tab = self.open_tab(file_path)
+        if file_path in (tab.current_file, tab.loader and tab.loader.file_path):
+            # Already open in a tab
+            if remember:
+                self.add_to_recent(file_path)
+            return
+        self.read_file(tab, file_path, remember, encoding)
+    
+    def read_file(self, tab, file_path, remember=True, encoding=None):
+        self.cancel_loading(tab)
+        # Read the saved view before remembering the tab's current file, which may be file_path
+        state = self.file_states.get(file_path)
+        self.remember_file_state(tab)
+        self.close_large_view(tab)
+        encoding = encoding or detect_encoding(file_path)
+        tab.journal.stop()
+        self.clear_bookmarks(tab)
+        stat = os.stat(file_path)
+        # The mmap view splits lines on b'\n', which needs a byte-oriented encoding
+        if stat.st_size >= self.large_file_threshold and not encoding.startswith('utf-16') \
+                and not encoding.startswith('utf-32'):
+            self.open_large_file(tab, file_path, encoding, remember)
+            return
+        # The cached preview stands in for the file's start if it is unchanged
+        preview = None
+        if state and state.get('preview') and \
+                (state.get('size'), state.get('mtime'), state.get('encoding')) == (stat.st_size, stat.st_mtime, encoding):
+            preview = state['preview']
+        tab.loader = FileLoader(file_path, encoding, preview)
+        tab.remember_loaded = remember
+        tab.restore_view = (state['cursor'], state['yview']) if state else None
+        
+        # Read-only while streaming; the load itself is not an undo step
+        tab.text.config(undo=False)
+        tab.text.delete(1.0, tk.END)
+        if preview:
+            tab.text.insert('1.0', preview)
+            tab.text.mark_set(tk.INSERT, tab.restore_view[0])
+            tab.text.see(tk.INSERT)
+        tab.text.config(state=tk.DISABLED)
+        tab.current_file = None
+        self.update_highlighter(tab)
+        self.set_title(tab, f"Enhanced Notepad Pro - Loading {os.path.basename(file_path)}...")
+        if tab is self.tab:
+            self.cancel_button.pack(side=tk.RIGHT)
+        
+        tab.loader.start()
+        self.root.after(1, self.poll_loader, tab)
+    
+    def poll_loader(self, tab):
+        loader = tab.loader
+        if loader is None:
+            return
+        
+        finished = False
+        deadline = time.perf_counter() + 0.03
+        tab.text.config(state=tk.NORMAL)
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    chunk = loader.chunks.get_nowait()
+                except queue.Empty:
+                    break
+                if chunk is None:
+                    finished = True
+                    break
+                if chunk is FileLoader.RESTART:
+                    tab.text.delete('1.0', tk.END)
+                    continue
+                tab.text.insert(tk.END, chunk)
+        finally:
+            tab.text.config(state=tk.DISABLED)
+        
+        if finished:
+            self.finish_loading(tab)
+        else:
+            if tab is self.tab:
+                self.status_bar.config(
+                    text=f"Loading {os.path.basename(loader.file_path)}... {loader.progress}% (Esc to cancel)")
+            self.root.after(10, self.poll_loader, tab)
+    
+    def finish_loading(self, tab):
+        loader = tab.loader
+        tab.loader = None
+        if tab is self.tab:
+            self.cancel_button.pack_forget()
+        tab.text.config(state=tk.NORMAL, undo=True)
+        
+        if loader.error:
+            self.reset_after_load(tab)
+            messagebox.showerror("Error", f"Could not open file: {str(loader.error)}")
+            tab.goto_line = tab.restore_view = None
+            return
+        
+        tab.text.edit_reset()
+        tab.text.edit_modified(False)
+        tab.text.mark_set(tk.INSERT, '1.0')
+        if tab.goto_line:
+            self.show_line(tab, tab.goto_line)
+        elif tab.restore_view:
+            tab.text.mark_set(tk.INSERT, tab.restore_view[0])
+            tab.text.yview_moveto(tab.restore_view[1])
+        tab.goto_line = tab.restore_view = None
+        tab.current_file = loader.file_path
+        tab.loaded = True
+        tab.file_encoding = loader.encoding
+        tab.line_ending = loader.newlines if isinstance(loader.newlines, str) else os.linesep
+        self.update_highlighter(tab)
+        tab.journal.start(tab.current_file, tab.file_encoding)
+        tab.modified = False
+        self.set_title(tab, f"Enhanced Notepad Pro - {tab.name}")
+        if tab.remember_loaded:
+            self.add_to_recent(loader.file_path)
+        if tab is self.tab:
+            self.status.mark('modified')
+            self.live_speller.reset()
+            self.live_grammar_checker.reset()
+            self.update_status()
+    
+    def cancel_loading(self, tab=None):
+        tab = tab or self.tab
+        if tab.loader is None:
+            return
+        tab.loader.cancel()
+        tab.loader = None
+        if tab is self.tab:
+            self.cancel_button.pack_forget()
+            self.status_bar.config(text="Loading cancelled")
+        tab.text.config(state=tk.NORMAL, undo=True)
+        self.reset_after_load(tab)
+    
+    def open_large_file(self, tab, file_path, encoding, remember=True):
+        tab.large_view = LargeFileView(tab.text, tab.v_scrollbar, file_path, encoding, on_scroll=tab.gutter.schedule)
+        self.update_highlighter(tab)
+        tab.current_file = file_path
+        tab.file_encoding = encoding
+        tab.modified = False
+        self.set_title(tab, f"Enhanced Notepad Pro - {tab.name} [large file, read-only]")
+        if remember:
+            self.add_to_recent(file_path)
+        if tab is self.tab:
+            self.status.mark('modified')
+            self.live_speller.reset()
+            self.live_grammar_checker.reset()
+            self.update_status()
+        self.root.after(250, self.poll_large_index, tab)
+    
+    def poll_large_index(self, tab):
+        # Keep the line total and scrollbar current while the index is built
+        if tab.large_view is None:
+            return
+        tab.large_view.update_scrollbar()
+        if tab is self.tab:
+            self.update_status()
+        if not tab.large_view.index.done:
+            self.root.after(250, self.poll_large_index, tab)
+    
+    def close_large_view(self, tab=None):
+        tab = tab or self.tab
+        if tab.large_view is None:
+            return
+        tab.large_view.close()
+        tab.large_view = None
+        tab.current_file = None
+        tab.modified = False
+        if tab is self.tab:
+            self.status.mark('modified')
+        tab.journal.start(None, tab.file_encoding)
+    
+    def update_highlighter(self, tab):
+        # Syntax highlighting follows the file extension; the large-file view has none
+        tab.highlighter.set_lexer(None if tab.large_view else lexer_for(tab.current_file))
+    
+    def reset_after_load(self, tab):
+        self.clear_bookmarks(tab)
+        tab.text.delete(1.0, tk.END)
+        tab.text.edit_reset()
+        tab.text.edit_modified(False)
+        tab.current_file = None
+        tab.file_encoding = 'utf-8'
+        tab.line_ending = os.linesep
+        self.update_highlighter(tab)
+        tab.journal.start(None, tab.file_encoding)
+        tab.modified = False
+        if tab is self.tab:
+            self.status.mark('modified')
+        self.set_title(tab, "Enhanced Notepad Pro - New File")
+            
+    def save_file(self, wait=False):
+        if self.loader or self.saver:
+            return
+        if self.large_view:
+            messagebox.showinfo("Save", "Large files are opened read-only.")
+            return
+        if self.current_file:
+            self.write_file(self.tab, self.current_file, wait)
         else:
-            self.save_as_file()
+            self.save_as_file(wait)
             
-    def save_as_file(self):
+    def save_as_file(self, wait=False):
+        if self.loader or self.saver:
+            return
+        if self.large_view:
+            messagebox.showinfo("Save", "Large files are opened read-only.")
+            return
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
             filetypes=[("Text Files", "*.txt"), ("All Files", "*.*")]
         )
         
         if file_path:
-            try:
-                with open(file_path, "w", encoding="utf-8") as file:
-                    file.write(self.text_area.get(1.0, tk.END)[:-1])
-                self.current_file = file_path
-                self.modified = False
-                self.root.title(f"Enhanced Notepad Pro - {os.path.basename(file_path)}")
-                self.add_to_recent(file_path)
-                messagebox.showinfo("Save", "File saved successfully!")
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not save file: {str(e)}")
+            self.write_file(self.tab, file_path, wait)
+    
+    def write_file(self, tab, file_path, wait=False):
+        # Large documents are written on a worker thread and stay read-only
+        # until it is done; the snapshot is a cheap document copy
+        self.autosaver.cancel(file_path)
+        saver = FileSaver(file_path, tab.document.copy(), tab.file_encoding, tab.line_ending)
+        if wait or len(saver.text) < BACKGROUND_SAVE_SIZE:
+            saver.run()
+            self.finish_saving(tab, saver)
+            return
+        tab.saver = saver
+        tab.text.config(state=tk.DISABLED)
+        saver.start()
+        self.root.after(10, self.poll_saver, tab)
+    
+    def poll_saver(self, tab):
+        saver = tab.saver
+        if saver is None:
+            return
+        if not saver.done:
+            if tab is self.tab:
+                self.status_bar.config(text=f"Saving {os.path.basename(saver.file_path)}... {saver.progress}%")
+            self.root.after(50, self.poll_saver, tab)
+            return
+        tab.saver = None
+        tab.text.config(state=tk.NORMAL)
+        self.finish_saving(tab, saver)
+    
+    def finish_saving(self, tab, saver):
+        if saver.error:
+            messagebox.showerror("Error", f"Could not save file: {str(saver.error)}")
+            return
+        tab.journal.start(saver.file_path, tab.file_encoding)
+        tab.current_file = saver.file_path
+        tab.loaded = True
+        tab.modified = False
+        self.update_tab_label(tab)
+        self.set_title(tab, f"Enhanced Notepad Pro - {tab.name}")
+        self.update_highlighter(tab)
+        self.add_to_recent(saver.file_path)
+        self.remember_file_state(tab)
+        if tab is self.tab:
+            self.status.mark('modified')
+            self.status_bar.config(text=f"Saved {tab.name}: {saver.stats.report()}")
+        messagebox.showinfo("Save", "File saved successfully!")
+    
+    def sync_save_format(self):
+        self.encoding_var.set(self.file_encoding)
+        self.line_ending_var.set(self.line_ending)
+    
+    def set_save_format(self):
+        # Changing either marks the buffer modified; the file changes on save
+        encoding, line_ending = self.encoding_var.get(), self.line_ending_var.get()
+        if self.loader or self.saver or self.large_view or \
+                (encoding, line_ending) == (self.file_encoding, self.line_ending):
+            self.sync_save_format()
+            return
+        self.file_encoding = encoding
+        self.line_ending = line_ending
+        self.modified = True
+        self.status.mark('modified')
+        self.update_tab_label(self.tab)
     
     def add_to_recent(self, file_path):
         if file_path in self.recent_files:
@@ -266,54 +3286,148 @@ class EnhancedNotepadPro:
         self.save_settings()
     
     def update_recent_menu(self):
+        # Sizes and missing files come from the last background check
         self.recent_menu.delete(0, tk.END)
         if self.recent_files:
             for file_path in self.recent_files:
+                label = os.path.basename(file_path)
+                size = self.recent_info.get(file_path, -1)
+                if size is None:
+                    label += "  (missing)"
+                elif size >= 0:
+                    label += f"  ({(size + 1023) // 1024:,} KB)"
                 self.recent_menu.add_command(
-                    label=os.path.basename(file_path), 
-                    command=lambda f=file_path: self.open_recent(f)
+                    label=label, 
+                    command=lambda f=file_path: self.open_recent(f),
+                    state=tk.DISABLED if size is None else tk.NORMAL
                 )
+            if None in self.recent_info.values():
+                self.recent_menu.add_separator()
+                self.recent_menu.add_command(label="Remove Missing Files", command=self.remove_missing_recent)
         else:
             self.recent_menu.add_command(label="No recent files", state=tk.DISABLED)
     
+    def check_recent_files(self):
+        # stat() on a worker, so a slow or unmounted drive never stalls the menu
+        if self.recent_check and self.recent_check.is_alive():
+            return
+        paths = list(self.recent_files)
+        results = {}
+        
+        def check():
+            for file_path in paths:
+                try:
+                    results[file_path] = os.stat(file_path).st_size
+                except OSError:
+                    results[file_path] = None
+        
+        self.recent_check = threading.Thread(target=check, daemon=True)
+        self.recent_check.start()
+        self.root.after(20, self.poll_recent_check, results)
+    
+    def poll_recent_check(self, results):
+        if self.recent_check.is_alive():
+            self.root.after(20, self.poll_recent_check, results)
+        elif results != self.recent_info:
+            self.recent_info = results
+            self.update_recent_menu()
+    
+    def remove_missing_recent(self):
+        self.recent_files = [f for f in self.recent_files if self.recent_info.get(f, -1) is not None]
+        self.update_recent_menu()
+        self.save_settings()
+    
+    def remember_file_state(self, tab):
+        # Cursor and scroll position, plus the file's start while it matches
+        # the disk, so reopening the file shows the old view at once
+        if not tab.current_file or not tab.loaded or tab.large_view or tab.loader:
+            return
+        if tab.text is not None:
+            cursor, yview = tab.text.index(tk.INSERT), tab.text.yview()[0]
+        else:
+            cursor, yview = tab.cursor, tab.yview
+        state = self.file_states.pop(tab.current_file, {})
+        state.update(cursor=cursor, yview=yview)
+        text = tab.document if tab.document is not None else tab.content
+        if not tab.modified and text is not None:
+            try:
+                stat = os.stat(tab.current_file)
+                state.update(size=stat.st_size, mtime=stat.st_mtime, encoding=tab.file_encoding,
+                             preview=text.get(0, PREVIEW_SIZE) if tab.document is not None else text[:PREVIEW_SIZE])
+            except OSError:
+                state.pop('preview', None)
+        self.file_states[tab.current_file] = state
+        while len(self.file_states) > MAX_FILE_STATES:
+            del self.file_states[next(iter(self.file_states))]
+        self.file_state_store.save()
+    
     def open_recent(self, file_path):
         try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                self.text_area.delete(1.0, tk.END)
-                self.text_area.insert(tk.END, file.read())
-            self.current_file = file_path
-            self.modified = False
-            self.root.title(f"Enhanced Notepad Pro - {os.path.basename(file_path)}")
+            self.load_file(file_path, remember=False)
         except:
             messagebox.showerror("Error", "File not found!")
     
-    def on_modified(self, event=None):
-        if self.text_area.edit_modified():
-            self.modified = True
-            self.modified_label.config(text="Modified")
-            self.text_area.edit_modified(False)
+    def on_modified(self, tab):
+        tab.gutter.schedule()
+        if tab.text.edit_modified():
+            tab.text.edit_modified(False)
+            if not tab.modified:
+                tab.modified = True
+                self.update_tab_label(tab)
+                self.status.mark('modified')
     
     def on_closing(self):
-        if self.modified:
-            response = messagebox.askyesnocancel("Save Changes", "Save before closing?")
+        self.speech.stop()
+        self.suggestions.save()
+        unsaved = []
+        for tab in list(self.tabs):
+            if not tab.modified:
+                continue
+            self.select_tab(tab)
+            response = messagebox.askyesnocancel("Save Changes", f"Save changes to {tab.name} before closing?")
+            if response is None:
+                return
             if response:
-                self.save_file()
-                self.save_settings()
-                self.root.destroy()
-            elif response is False:
-                self.save_settings()
-                self.root.destroy()
-        else:
-            self.save_settings()
-            self.root.destroy()
+                self.save_file(wait=True)
+                # Save As was cancelled or the write failed: keep the journal
+                if tab.modified:
+                    unsaved.append(tab)
+        self.shutdown(unsaved)
+    
+    def shutdown(self, unsaved=()):
+        for tab in self.tabs:
+            if tab.saver:
+                tab.saver.thread.join()
+            self.remember_file_state(tab)
+        try:
+            self.settings.flush(wait=True)
+            self.file_state_store.flush(wait=True)
+        except:
+            pass
+        self.search_index.cancelled.set()
+        for tab in self.tabs:
+            if tab.loader:
+                tab.loader.cancel()
+            if tab.large_view:
+                tab.large_view.close()
+            # Keep the recovery journal of buffers that were not saved
+            if tab in unsaved:
+                tab.journal.flush()
+            else:
+                tab.journal.stop()
+        self.root.destroy()
     
     def undo(self):
+        if self.tab.transform_job:
+            return
         try:
             self.text_area.edit_undo()
         except:
             pass
     
     def redo(self):
+        if self.tab.transform_job:
+            return
         try:
             self.text_area.edit_redo()
         except:
@@ -333,40 +3447,140 @@ class EnhancedNotepadPro:
         self.text_area.mark_set(tk.INSERT, "1.0")
         return 'break'
     
+    def toggle_bookmark(self, index=tk.INSERT):
+        # Bookmarks are Tk marks, so they move with the text around them
+        if self.large_view or self.loader:
+            return
+        line = self.text_area.index(index).split('.')[0]
+        on_line = [name for name in self.bookmarks if self.text_area.index(name).split('.')[0] == line]
+        for name in on_line:
+            self.text_area.mark_unset(name)
+            del self.bookmarks[name]
+        if not on_line:
+            self.bookmark_count += 1
+            name = f'bookmark{self.bookmark_count}'
+            self.text_area.mark_set(name, f'{line}.0')
+            self.text_area.mark_gravity(name, tk.LEFT)
+            self.bookmarks[name] = None
+        self.tab.gutter.schedule()
+    
+    def next_bookmark(self, backwards=False):
+        if not self.bookmarks:
+            self.status_bar.config(text="No bookmarks")
+            return
+        line = int(self.text_area.index(tk.INSERT).split('.')[0])
+        lines = sorted({int(self.text_area.index(name).split('.')[0]) for name in self.bookmarks})
+        # Wraps around at either end
+        i = bisect.bisect_left(lines, line) - 1 if backwards else bisect.bisect_right(lines, line)
+        target = f'{lines[i % len(lines)]}.0'
+        self.text_area.mark_set(tk.INSERT, target)
+        self.text_area.see(target)
+        self.update_status()
+    
+    def clear_bookmarks(self, tab):
+        for name in tab.bookmarks:
+            tab.text.mark_unset(name)
+        tab.bookmarks.clear()
+    
+    def toggle_line_numbers(self):
+        self.show_line_numbers = self.show_line_numbers_var.get()
+        for tab in self.tabs:
+            if tab.gutter is not None:
+                tab.gutter.set_show_numbers(self.show_line_numbers)
+        self.save_settings()
+    
+    def find_options(self, window):
+        # Entry plus match case / whole word / regex switches, prefilled from the last search
+        text, match_case, whole_word, regex = self.find_key or ('', False, False, False)
+        options = {
+            'match_case': tk.BooleanVar(value=match_case),
+            'whole_word': tk.BooleanVar(value=whole_word),
+            'regex': tk.BooleanVar(value=regex),
+        }
+        frame = tk.Frame(window)
+        frame.pack(pady=5)
+        tk.Checkbutton(frame, text="Match case", variable=options['match_case']).pack(side=tk.LEFT)
+        tk.Checkbutton(frame, text="Whole word", variable=options['whole_word']).pack(side=tk.LEFT)
+        tk.Checkbutton(frame, text="Regex", variable=options['regex']).pack(side=tk.LEFT)
+        return text, options
+    
+    def set_find_pattern(self, text, options, result_label):
+        if not text:
+            self.find_key = None
+            self.find_engine.clear()
+            return False
+        try:
+            self.find_engine.set_pattern(text, **{name: var.get() for name, var in options.items()})
+        except re.error as e:
+            result_label.config(text=f"Invalid pattern: {e}")
+            return False
+        self.find_key = self.find_engine.key
+        return True
+    
     def find_text(self):
         search_window = tk.Toplevel(self.root)
         search_window.title("Find")
-        search_window.geometry("400x150")
+        search_window.geometry("400x230")
         
         tk.Label(search_window, text="Find what:").pack(pady=5)
         search_entry = tk.Entry(search_window, width=40)
         search_entry.pack(pady=5)
+        last_text, options = self.find_options(search_window)
+        search_entry.insert(0, last_text)
+        search_entry.select_range(0, tk.END)
         search_entry.focus()
         
+        result_label = tk.Label(search_window, text="")
+        
+        def find(backwards=False):
+            if self.set_find_pattern(search_entry.get(), options, result_label):
+                i = self.find_next(backwards)
+                count = len(self.find_engine.matches)
+                result_label.config(text=f"Match {i + 1} of {count}" if i is not None else "Not found")
+        
         def find_all():
-            self.text_area.tag_remove('found', '1.0', tk.END)
-            search_text = search_entry.get()
-            
-            if search_text:
-                idx = '1.0'
-                count = 0
-                while True:
-                    idx = self.text_area.search(search_text, idx, nocase=1, stopindex=tk.END)
-                    if not idx:
-                        break
-                    lastidx = f'{idx}+{len(search_text)}c'
-                    self.text_area.tag_add('found', idx, lastidx)
-                    idx = lastidx
-                    count += 1
-                
-                messagebox.showinfo("Find", f"Found {count} occurrence(s)")
+            if self.set_find_pattern(search_entry.get(), options, result_label):
+                self.find_engine.search()
+                result_label.config(text=f"Found {len(self.find_engine.matches)} occurrence(s)")
+        
+        buttons = tk.Frame(search_window)
+        buttons.pack(pady=5)
+        tk.Button(buttons, text="Find Next", command=find, width=12).pack(side=tk.LEFT, padx=2)
+        tk.Button(buttons, text="Find Previous", command=lambda: find(True), width=12).pack(side=tk.LEFT, padx=2)
+        tk.Button(buttons, text="Find All", command=find_all, width=12).pack(side=tk.LEFT, padx=2)
+        result_label.pack(pady=5)
+        
+        search_entry.bind('<Return>', lambda e: find())
+        search_entry.bind('<Shift-Return>', lambda e: find(True))
+    
+    def find_next(self, backwards=False):
+        engine = self.find_engine
+        if self.find_key is None:
+            self.find_text()
+            return None
+        # The last search carries over to other tabs
+        engine.set_pattern(*self.find_key)
+        
+        # Searching backwards starts from the current match, forwards from its end
+        start = tk.SEL_FIRST if backwards and self.text_area.tag_ranges(tk.SEL) else tk.INSERT
+        line, col = map(int, self.text_area.index(start).split('.'))
+        i = engine.locate(line, col, backwards)
+        if i is None:
+            self.status_bar.config(text="Not found")
+            return None
         
-        tk.Button(search_window, text="Find All", command=find_all, width=15).pack(pady=10)
+        start, end = engine.span(engine.matches[i])
+        self.text_area.tag_remove(tk.SEL, '1.0', tk.END)
+        self.text_area.tag_add(tk.SEL, start, end)
+        self.text_area.mark_set(tk.INSERT, end)
+        self.text_area.see(start)
+        self.find_index = self.text_area.index(start)
+        return i
     
     def replace_text(self):
         replace_window = tk.Toplevel(self.root)
         replace_window.title("Replace")
-        replace_window.geometry("400x200")
+        replace_window.geometry("400x280")
         
         tk.Label(replace_window, text="Find:").pack(pady=5)
         find_entry = tk.Entry(replace_window, width=40)
@@ -376,14 +3590,225 @@ class EnhancedNotepadPro:
         replace_entry = tk.Entry(replace_window, width=40)
         replace_entry.pack(pady=5)
         
-        def replace_all():
-            content = self.text_area.get(1.0, tk.END)
-            new_content = content.replace(find_entry.get(), replace_entry.get())
-            self.text_area.delete(1.0, tk.END)
-            self.text_area.insert(1.0, new_content)
-            messagebox.showinfo("Replace", "Replacement complete!")
+        last_text, options = self.find_options(replace_window)
+        find_entry.insert(0, last_text)
+        find_entry.focus()
+        result_label = tk.Label(replace_window, text="")
+        
+        def do_replace_all():
+            if not find_entry.get():
+                return
+            # Tk ignores edits to a disabled widget, so say so instead
+            tab = self.tab
+            if tab.loader or tab.saver or tab.large_view or tab.transform_job:
+                result_label.config(text="The document is read-only right now")
+                return
+            try:
+                pattern = compile_search(find_entry.get(), **{name: var.get() for name, var in options.items()})
+                count = replace_all(self.text_area, tab.document.text(), pattern, replace_entry.get(), expand=options['regex'].get())
+            except re.error as e:
+                result_label.config(text=f"Invalid pattern: {e}")
+                return
+            result_label.config(text=f"Replaced {count} occurrence(s)")
+        
+        tk.Button(replace_window, text="Replace All", command=do_replace_all, width=15).pack(pady=10)
+        result_label.pack(pady=5)
+    
+    def find_in_files(self):
+        files_window = tk.Toplevel(self.root)
+        files_window.title("Find in Files")
+        files_window.geometry("700x480")
+        
+        query_frame = tk.Frame(files_window)
+        query_frame.pack(fill=tk.X, padx=5, pady=5)
+        query_entry = tk.Entry(query_frame)
+        query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        query_entry.focus()
+        
+        results_frame = tk.Frame(files_window)
+        results_frame.pack(fill=tk.BOTH, expand=True, padx=5)
+        results = tk.Listbox(results_frame, font=('Consolas', 10), activestyle=tk.NONE)
+        scrollbar = tk.Scrollbar(results_frame, command=results.yview)
+        results.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        results.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        self.files_status = tk.Label(files_window, text="", anchor=tk.W)
+        self.files_status.pack(fill=tk.X, padx=5)
+        hits = []
+        generation = [0]
+        
+        def search():
+            start = time.perf_counter()
+            try:
+                found, files = self.search_index.search(query_entry.get())
+            except Exception as e:
+                self.files_status.config(text=f"Search failed: {str(e)}")
+                return
+            elapsed = (time.perf_counter() - start) * 1000
+            hits[:] = found
+            results.delete(0, tk.END)
+            rows = {}
+            for row, (path, line) in enumerate(found):
+                results.insert(tk.END, f"{path}:{line}:")
+                rows.setdefault(path, []).append((row, line))
+            more = f" (first {len(found)} shown)" if files and len(found) >= 500 else ""
+            self.files_status.config(text=f"{len(found)} match(es) in {files} file(s), {elapsed:.1f} ms{more}")
+            
+            # Previews mean reading every hit file up to its last hit, so a
+            # worker reads them and the rows are filled in as they arrive
+            generation[0] += 1
+            job = generation[0]
+            previews = queue.Queue()
+            
+            def read():
+                for path, path_rows in rows.items():
+                    if job != generation[0]:
+                        return
+                    previews.put((path, line_previews(path, [line for _, line in path_rows])))
+                previews.put(None)
+            
+            threading.Thread(target=read, daemon=True).start()
+            self.root.after(20, show_previews, job, rows, previews)
+        
+        def show_previews(job, rows, previews):
+            if job != generation[0]:
+                return
+            selected = results.curselection()
+            while True:
+                try:
+                    item = previews.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    return
+                path, texts = item
+                for row, line in rows[path]:
+                    results.delete(row)
+                    results.insert(row, f"{path}:{line}: {texts.get(line, '').strip()[:200]}")
+                    if row in selected:
+                        results.selection_set(row)
+            self.root.after(20, show_previews, job, rows, previews)
+        
+        def open_selected(event=None):
+            if results.curselection():
+                self.open_location(*hits[results.curselection()[0]])
+        
+        tk.Button(query_frame, text="Search", command=search, width=10).pack(side=tk.LEFT, padx=5)
+        query_entry.bind('<Return>', lambda e: search())
+        results.bind('<Double-Button-1>', open_selected)
+        results.bind('<Return>', open_selected)
+        
+        # Folders to index besides the recent files
+        folders_frame = tk.LabelFrame(files_window, text="Indexed folders (recent files are always included)")
+        folders_frame.pack(fill=tk.X, padx=5, pady=5)
+        folders = tk.Listbox(folders_frame, height=3)
+        folders.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5, pady=5)
+        for folder in self.search_folders:
+            folders.insert(tk.END, folder)
+        
+        def add_folder():
+            folder = filedialog.askdirectory(parent=files_window)
+            if folder and folder not in self.search_folders:
+                self.search_folders.append(folder)
+                folders.insert(tk.END, folder)
+                self.save_settings()
+                self.start_indexing()
+        
+        def remove_folder():
+            if folders.curselection():
+                i = folders.curselection()[0]
+                del self.search_folders[i]
+                folders.delete(i)
+                self.save_settings()
+                self.start_indexing()
+        
+        def set_pattern(event=None):
+            pattern = pattern_entry.get().strip() or '*.txt;*.md'
+            if pattern != self.search_pattern:
+                self.search_pattern = pattern
+                self.save_settings()
+                self.start_indexing()
+        
+        buttons = tk.Frame(folders_frame)
+        buttons.pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Add Folder...", command=add_folder, width=12).pack(pady=2)
+        tk.Button(buttons, text="Remove", command=remove_folder, width=12).pack(pady=2)
+        tk.Label(buttons, text="File types:").pack()
+        pattern_entry = tk.Entry(buttons, width=14)
+        pattern_entry.insert(0, self.search_pattern)
+        pattern_entry.pack(pady=2)
+        pattern_entry.bind('<Return>', set_pattern)
+        pattern_entry.bind('<FocusOut>', set_pattern)
+        
+        def closed(event):
+            if event.widget is files_window:
+                self.files_status = None
+                generation[0] += 1
+        files_window.bind('<Destroy>', closed)
+        self.start_indexing()
+    
+    def start_indexing(self):
+        # Re-index on a worker thread; only changed files are read again
+        if self.index_thread is not None and self.index_thread.is_alive():
+            self.index_again = True
+            return
+        folders = list(self.search_folders)
+        pattern = self.search_pattern
+        recent = list(self.recent_files)
+        
+        def index():
+            try:
+                paths = list(expand_paths(folders, pattern))
+                paths.extend(path for path in recent if os.path.isfile(path))
+                self.search_index.update(paths)
+            except Exception as e:
+                self.index_error = e
+            finally:
+                self.search_index.close()
         
-        tk.Button(replace_window, text="Replace All", command=replace_all, width=15).pack(pady=10)
+        self.index_again = False
+        self.index_error = None
+        os.makedirs(user_data_dir(), exist_ok=True)
+        self.index_thread = threading.Thread(target=index, daemon=True)
+        self.index_thread.start()
+        self.root.after(200, self.poll_indexing)
+    
+    def poll_indexing(self):
+        running = self.index_thread.is_alive()
+        if self.files_status is not None:
+            index = self.search_index
+            if running:
+                self.files_status.config(text=f"Indexing... {index.done} of {index.total} files checked")
+            elif self.index_error:
+                self.files_status.config(text=f"Indexing failed: {self.index_error}")
+            elif self.files_status.cget('text').startswith("Indexing"):
+                self.files_status.config(text=f"Index up to date ({index.total} files)")
+        if running:
+            self.root.after(200, self.poll_indexing)
+        elif self.index_again:
+            self.start_indexing()
+    
+    def open_location(self, file_path, line):
+        try:
+            self.load_file(file_path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not open file: {str(e)}")
+            return
+        tab = self.tab
+        if tab.loader:
+            tab.goto_line = line
+        elif tab.large_view:
+            tab.large_view.show_line(line - 1)
+        else:
+            self.show_line(tab, line)
+    
+    def show_line(self, tab, line):
+        tab.text.mark_set(tk.INSERT, f'{line}.0')
+        tab.text.see(tk.INSERT)
+        tab.text.focus_set()
+        if tab is self.tab:
+            self.update_status()
     
     def insert_datetime(self):
         now = datetime.now()
@@ -406,83 +3831,114 @@ class EnhancedNotepadPro:
             selection = font_listbox.curselection()
             if selection:
                 self.font_family = font_listbox.get(selection[0])
-                self.text_area.config(font=(self.font_family, self.font_size))
+                self.apply_theme()
                 font_window.destroy()
         
         tk.Button(font_window, text="Apply", command=apply_font).pack(pady=10)
     
     def change_font_size(self, size):
         self.font_size = int(size)
-        self.text_area.config(font=(self.font_family, self.font_size))
+        self.apply_theme()
     
     def increase_font(self):
         self.font_size += 2
         self.font_size_var.set(str(self.font_size))
-        self.text_area.config(font=(self.font_family, self.font_size))
+        self.apply_theme()
     
     def decrease_font(self):
         if self.font_size > 8:
             self.font_size -= 2
             self.font_size_var.set(str(self.font_size))
-            self.text_area.config(font=(self.font_family, self.font_size))
+            self.apply_theme()
     
     def toggle_dark_mode(self):
         self.dark_mode = not self.dark_mode
         self.apply_theme()
     
     def apply_theme(self):
+        for tab in self.tabs:
+            if tab.text is not None:
+                self.style_tab(tab)
+    
+    def style_tab(self, tab):
+        tab.text.config(font=(self.font_family, self.font_size))
         if self.dark_mode:
-            self.text_area.config(bg='#1e1e1e', fg='#d4d4d4', insertbackground='white')
+            tab.text.config(bg='#1e1e1e', fg='#d4d4d4', insertbackground='white')
+            tab.gutter.set_colors('#252526', '#858585')
         else:
-            self.text_area.config(bg='white', fg='black', insertbackground='black')
+            tab.text.config(bg='white', fg='black', insertbackground='black')
+            tab.gutter.set_colors('#f0f0f0', '#858585')
+        for kind, (light, dark) in SYNTAX_COLORS.items():
+            tab.text.tag_configure(f'syntax:{kind}', foreground=dark if self.dark_mode else light)
+            tab.text.tag_lower(f'syntax:{kind}')
     
     def speak_text(self):
-        text = self.text_area.get(1.0, tk.END).strip()
-        if text:
-            try:
-                engine.say(text)
-                engine.runAndWait()
-            except Exception as e:
-                messagebox.showerror("Error", f"Speech error: {str(e)}")
+        text = self.document.text()
+        sentences = [(f'{line}.{start}', f'{line}.{end}', match.group())
+                     for line, start, end, match in iter_matches(SENTENCE_RE, text)]
+        if sentences:
+            # Stopping first lets the 'finished' event of the old reading
+            # clear its highlight before speech_tab moves to this tab
+            self.speech.stop()
+            self.speech_tab = self.tab
+            self.speech.speak(sentences)
         else:
             messagebox.showinfo("Speak", "No text to speak!")
     
+    def pause_speech(self):
+        self.speech.pause()
+    
+    def skip_sentence(self):
+        self.speech.skip()
+    
+    def stop_speech(self):
+        self.speech.stop()
+    
+    def on_speech_event(self, kind, value):
+        # Highlights go to the tab that is being read, shown or not
+        tab = self.speech_tab
+        if tab is None or tab.text is None:
+            return
+        tab.text.tag_remove('speaking', '1.0', tk.END)
+        if kind == 'sentence':
+            start, end = value
+            tab.text.tag_add('speaking', start, end)
+            tab.text.see(start)
+        else:
+            self.speech_tab = None
+        if kind == 'error':
+            messagebox.showerror("Error", f"Speech error: {str(value)}")
+    
     def configure_voice(self):
         voice_window = tk.Toplevel(self.root)
         voice_window.title("Voice Settings")
         voice_window.geometry("400x250")
         
         tk.Label(voice_window, text="Speech Rate:").pack(pady=10)
-        rate_var = tk.IntVar(value=engine.getProperty('rate'))
+        rate_var = tk.IntVar(value=self.speech_rate)
+        # Slider changes reach the speech thread before its next sentence
         rate_slider = tk.Scale(voice_window, from_=50, to=300, orient=tk.HORIZONTAL, 
-                              variable=rate_var, length=300)
+                              variable=rate_var, length=300,
+                              command=lambda value: self.speech.set_rate(int(float(value))))
         rate_slider.pack()
         
         def apply_settings():
-            engine.setProperty('rate', rate_var.get())
+            self.speech_rate = rate_var.get()
+            self.speech.set_rate(self.speech_rate)
+            self.save_settings()
             messagebox.showinfo("Success", "Voice settings applied!")
             voice_window.destroy()
         
         tk.Button(voice_window, text="Apply", command=apply_settings).pack(pady=10)
     
     def check_spelling(self):
-        text = self.text_area.get(1.0, tk.END)
-        words = re.findall(r'\b\w+\b', text)
-        misspelled = spell.unknown(words)
+        text = self.document.text()
+        spans, misspelled = misspelled_spans(text, get_spell_checker())
         
         self.text_area.tag_remove('misspelled', '1.0', tk.END)
+        tag_spans(self.text_area, 'misspelled', spans)
         
         if misspelled:
-            for word in misspelled:
-                idx = '1.0'
-                while True:
-                    idx = self.text_area.search(word, idx, nocase=1, stopindex=tk.END)
-                    if not idx:
-                        break
-                    lastidx = f'{idx}+{len(word)}c'
-                    self.text_area.tag_add('misspelled', idx, lastidx)
-                    idx = lastidx
-            
             misspelled_list = list(misspelled)[:20]
             msg = "Misspelled words:\n\n" + ", ".join(misspelled_list)
             if len(misspelled) > 20:
@@ -491,110 +3947,231 @@ class EnhancedNotepadPro:
         else:
             messagebox.showinfo("Spell Check", "No spelling errors!")
     
-    def grammar_check(self):
-        text = self.text_area.get(1.0, tk.END).strip()
-        if not text:
-            messagebox.showinfo("Grammar Check", "No text to check!")
-            return
+    def show_spelling_menu(self, event):
+        index = self.text_area.index(f'@{event.x},{event.y}')
+        if 'misspelled' not in self.text_area.tag_names(index):
+            return self.show_grammar_menu(event, index)
+        start, end = self.text_area.tag_prevrange('misspelled', f'{index}+1c')
+        word = self.text_area.get(start, end)
         
-        issues = []
-        sentences = re.split(r'[.!?]+', text)
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if sentence and not sentence[0].isupper():
-                issues.append(f"Capitalize: '{sentence[:30]}...'")
+        menu = tk.Menu(self.root, tearoff=0)
+        suggestions = self.suggestions.suggest(word)
+        for suggestion in suggestions:
+            suggestion = match_case(suggestion, word)
+            menu.add_command(label=suggestion,
+                             command=lambda s=suggestion: self.replace_word(start, end, s))
+        if not suggestions:
+            menu.add_command(label="No suggestions", state=tk.DISABLED)
+        menu.tk_popup(event.x_root, event.y_root)
+        return 'break'
+    
+    def show_grammar_menu(self, event, index):
+        names = [tag[len('grammar:'):] for tag in self.text_area.tag_names(index)
+                 if tag.startswith('grammar:')]
+        rules = [self.grammar.rules[name] for name in names if name in self.grammar.rules]
+        if not rules:
+            return
         
-        if issues:
-            msg = f"Found {len(issues)} issue(s):\n\n" + "\n".join(issues[:10])
-            messagebox.showinfo("Grammar Check", msg)
-        else:
-            messagebox.showinfo("Grammar Check", "No issues found!")
+        menu = tk.Menu(self.root, tearoff=0)
+        for rule in rules:
+            start, end = self.text_area.tag_prevrange(f'grammar:{rule.name}', f'{index}+1c')
+            menu.add_command(label=rule.message, state=tk.DISABLED)
+            if rule.fix:
+                fixed = rule.fix(self.text_area.get(start, end))
+                menu.add_command(label=f"Change to '{fixed}'" if fixed.strip() else "Fix",
+                                 command=lambda s=start, e=end, f=fixed: self.replace_word(s, e, f))
+        menu.tk_popup(event.x_root, event.y_root)
+        return 'break'
+    
+    def replace_word(self, start, end, word):
+        self.text_area.edit_separator()
+        self.text_area.delete(start, end)
+        self.text_area.insert(start, word)
+        self.text_area.edit_separator()
+        self.text_area.tag_remove('misspelled', start, f'{start}+{len(word)}c')
+        clear_grammar(self.text_area, self.grammar, start, f'{start}+{len(word)}c')
+    
+    def show_suggestion_stats(self):
+        cache = self.suggestions.cache
+        stats = f"""Suggestion Cache:
+
+Entries: {len(cache)} / {cache.maxsize}
+Hits: {cache.hits}
+Misses: {cache.misses}
+Hit rate: {cache.hit_rate:.0%}"""
+        messagebox.showinfo("Suggestion Cache", stats)
+    
+    def toggle_live_spell(self):
+        self.live_spell = self.live_spell_var.get()
+        self.live_speller.enable(self.live_spell)
+        self.save_settings()
+    
+    def grammar_check(self):
+        if self.large_view:
+            messagebox.showinfo("Grammar Check", "Grammar check is not available for large files.")
+            return
+        start = time.perf_counter()
+        clear_grammar(self.text_area, self.grammar)
+        count = tag_grammar(self.text_area, self.grammar.issues(self.document.iter_lines()))
+        elapsed = (time.perf_counter() - start) * 1000
+        self.status_bar.config(text=f"Grammar: {count} issue(s) in {elapsed:.0f} ms"
+                                    " (right-click an underlined phrase)" if count else
+                                    f"Grammar: no issues found ({elapsed:.0f} ms)")
+    
+    def toggle_live_grammar(self):
+        self.live_grammar = self.live_grammar_var.get()
+        self.live_grammar_checker.enable(self.live_grammar)
+        self.save_settings()
+    
+    def show_grammar_timings(self):
+        rows = sorted(self.grammar.timings.items(), key=lambda item: -item[1][0])
+        lines = [f"{name}: {seconds * 1000:.1f} ms, {sentences} sentences, {issues} issues"
+                 for name, (seconds, sentences, issues) in rows]
+        cache = self.grammar.cache
+        stats = "Grammar Rules:\n\n" + ("\n".join(lines) if lines else "Nothing checked yet") + f"""
+
+Sentence Cache:
+Entries: {len(cache)} / {cache.maxsize}
+Hit rate: {cache.hit_rate:.0%}"""
+        messagebox.showinfo("Grammar Rule Timings", stats)
     
     def show_word_count(self):
-        text = self.text_area.get(1.0, tk.END)
-        words = len(re.findall(r'\b\w+\b', text))
-        chars = len(text) - 1
-        lines = text.count('\n')
-        
         stats = f"""Statistics:
 
-Words: {words}
-Characters: {chars}
-Lines: {lines}"""
+Words: {self.text_stats.words}
+Characters: {self.text_stats.chars}
+Lines: {self.text_stats.lines}"""
         
         messagebox.showinfo("Word Count", stats)
     
     def to_uppercase(self):
-        try:
-            selected = self.text_area.get(tk.SEL_FIRST, tk.SEL_LAST)
-            self.text_area.delete(tk.SEL_FIRST, tk.SEL_LAST)
-            self.text_area.insert(tk.INSERT, selected.upper())
-        except:
-            text = self.text_area.get(1.0, tk.END)
-            self.text_area.delete(1.0, tk.END)
-            self.text_area.insert(1.0, text.upper())
+        self.convert_case('upper')
     
     def to_lowercase(self):
-        try:
-            selected = self.text_area.get(tk.SEL_FIRST, tk.SEL_LAST)
-            self.text_area.delete(tk.SEL_FIRST, tk.SEL_LAST)
-            self.text_area.insert(tk.INSERT, selected.lower())
-        except:
-            text = self.text_area.get(1.0, tk.END)
-            self.text_area.delete(1.0, tk.END)
-            self.text_area.insert(1.0, text.lower())
+        self.convert_case('lower')
     
     def to_titlecase(self):
-        try:
-            selected = self.text_area.get(tk.SEL_FIRST, tk.SEL_LAST)
-            self.text_area.delete(tk.SEL_FIRST, tk.SEL_LAST)
-            self.text_area.insert(tk.INSERT, selected.title())
-        except:
-            text = self.text_area.get(1.0, tk.END)
-            self.text_area.delete(1.0, tk.END)
-            self.text_area.insert(1.0, text.title())
+        self.convert_case('title')
+    
+    def convert_case(self, name):
+        if not self.text_area.tag_ranges(tk.SEL):
+            self.run_transform(name)
+            return
+        # A selection converts just the selected characters
+        start, end = self.text_area.index(tk.SEL_FIRST), self.text_area.index(tk.SEL_LAST)
+        converted = TRANSFORMS[name]().convert(self.text_area.get(start, end))
+        self.text_area.edit_separator()
+        self.text_area.replace(start, end, converted)
+        self.text_area.edit_separator()
+        self.text_area.tag_add(tk.SEL, start, f'{start}+{len(converted)}c')
+    
+    def run_transform(self, name):
+        # Whole buffer, or the lines the selection touches
+        tab = self.tab
+        if tab.loader or tab.saver or tab.large_view or tab.transform_job:
+            return
+        first, last = 1, None
+        if self.text_area.tag_ranges(tk.SEL):
+            first = int(self.text_area.index(tk.SEL_FIRST).split('.')[0])
+            last = max(first, int(self.text_area.index(f'{tk.SEL_LAST}-1c').split('.')[0]))
+        transform = TRANSFORMS[name]()
+        tab.transform_job = TransformJob(self.root, tab.text, tab.document, transform, first, last,
+                                         on_progress=lambda percent: self.show_transform_progress(tab, percent),
+                                         on_done=lambda job: self.finish_transform(tab, job))
+        tab.transform_job.start()
+    
+    def show_transform_progress(self, tab, percent):
+        if tab is self.tab:
+            self.status_bar.config(text=f"{tab.transform_job.transform.label}... {percent}% (Esc to cancel)")
+    
+    def finish_transform(self, tab, job):
+        tab.transform_job = None
+        if tab is self.tab:
+            self.status_bar.config(text=f"{job.transform.label}: {'cancelled' if job.cancelled else 'done'}")
+    
+    def cancel_transform(self):
+        if self.tab.transform_job:
+            self.tab.transform_job.cancel()
     
     def update_status(self, event=None):
+        self.status.mark('status')
+    
+    def status_text(self):
         try:
-            line, col = self.text_area.index(tk.INSERT).split('.')
-            text = self.text_area.get(1.0, tk.END)
-            words = len(re.findall(r'\b\w+\b', text))
-            self.status_bar.config(text=f"Line: {line} | Col: {col} | Words: {words}")
+            return format_status(self.text_area, self.text_stats, self.large_view)
         except:
-            pass
+            return None
+    
+    def modified_text(self):
+        if self.tab is None:
+            return None
+        return "Read-only" if self.large_view else "Modified" if self.modified else ""
     
     def schedule_auto_save(self):
-        if self.modified and self.current_file:
-            try:
-                with open(self.current_file, "w", encoding="utf-8") as file:
-                    file.write(self.text_area.get(1.0, tk.END)[:-1])
-            except:
-                pass
+        for tab in self.tabs:
+            self.auto_save(tab)
         self.root.after(self.auto_save_interval, self.schedule_auto_save)
     
+    def auto_save(self, tab):
+        # Snapshot on the Tk thread, write on the autosave thread
+        if not tab.modified or tab.loader or tab.saver or tab.large_view:
+            return
+        journal = tab.journal
+        token = journal.rotate()
+        if token is None:
+            return
+        text = tab.document.copy()
+        if tab.current_file:
+            self.autosaver.submit(tab.current_file, tab.current_file, text, tab.file_encoding,
+                                  lambda written: journal.commit(token), tab.line_ending)
+        else:
+            snapshot = journal.snapshot_path(token[1])
+            self.autosaver.submit((journal.session, token[0]), snapshot, text, tab.file_encoding,
+                                  lambda written: journal.commit(token, snapshot if written else None))
+    
     def save_settings(self):
+        self.settings.save()
+    
+    def collect_settings(self):
+        open_files = [tab.current_file or tab.loader.file_path for tab in self.tabs
+                      if tab.current_file or tab.loader]
         settings = {
             'recent_files': self.recent_files,
             'font_family': self.font_family,
             'font_size': self.font_size,
-            'dark_mode': self.dark_mode
+            'dark_mode': self.dark_mode,
+            'live_spell': self.live_spell,
+            'live_grammar': self.live_grammar,
+            'suggestion_cache_size': self.suggestion_cache_size,
+            'speech_rate': self.speech_rate,
+            'open_files': open_files,
+            'active_tab': open_files.index(self.tab.current_file) if self.tab.current_file in open_files else 0,
+            'max_live_tabs': self.max_live_tabs,
+            'show_line_numbers': self.show_line_numbers,
+            'search_folders': self.search_folders,
+            'search_pattern': self.search_pattern
         }
-        try:
-            with open(self.config_file, 'w') as f:
-                json.dump(settings, f)
-        except:
-            pass
+        return settings
     
     def load_settings(self):
+        self.file_states = self.file_state_store.load()
         try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    settings = json.load(f)
-                    self.recent_files = settings.get('recent_files', [])
-                    self.font_family = settings.get('font_family', 'Consolas')
-                    self.font_size = settings.get('font_size', 14)
-                    self.dark_mode = settings.get('dark_mode', False)
+            # Older versions kept the settings in the working directory
+            settings = self.settings.load("notepad_config.json")
+            self.recent_files = settings.get('recent_files', [])
+            self.font_family = settings.get('font_family', 'Consolas')
+            self.font_size = settings.get('font_size', 14)
+            self.dark_mode = settings.get('dark_mode', False)
+            self.live_spell = settings.get('live_spell', False)
+            self.live_grammar = settings.get('live_grammar', False)
+            self.suggestion_cache_size = settings.get('suggestion_cache_size', 2000)
+            self.speech_rate = settings.get('speech_rate', 200)
+            self.open_files = settings.get('open_files', [])
+            self.active_tab = settings.get('active_tab', 0)
+            self.max_live_tabs = settings.get('max_live_tabs', 4)
+            self.show_line_numbers = settings.get('show_line_numbers', True)
+            self.search_folders = settings.get('search_folders', [])
+            self.search_pattern = settings.get('search_pattern', '*.txt;*.md')
         except:
             pass
     
@@ -604,15 +4181,42 @@ Lines: {lines}"""
 Ctrl+N - New File
 Ctrl+O - Open File
 Ctrl+S - Save File
+Ctrl+W - Close Tab
+Ctrl+Tab - Next Tab
 Ctrl+F - Find
 Ctrl+H - Replace
+Ctrl+Shift+F - Find in Files
 Ctrl+A - Select All
 Ctrl++ - Zoom In
 Ctrl+- - Zoom Out
 Ctrl+D - Dark Mode
-F5 - Insert Date/Time"""
+Ctrl+F2 - Toggle Bookmark
+F2 / Shift+F2 - Next / Previous Bookmark
+F5 - Insert Date/Time
+F12 - Latency Overlay (with --instrument)"""
         messagebox.showinfo("Shortcuts", shortcuts)
     
+    def export_timings(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".json",
+                                                 filetypes=[("JSON files", "*.json"), ("All files", "*.*")])
+        if file_path:
+            try:
+                self.profiler.export_json(file_path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not export timings: {str(e)}")
+    
+    def save_cprofile(self):
+        if self.profiler.cprofile is None:
+            messagebox.showinfo("cProfile", "Turn on Help > Record cProfile first.")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".prof",
+                                                 filetypes=[("Profile dumps", "*.prof"), ("All files", "*.*")])
+        if file_path:
+            try:
+                self.profiler.dump_cprofile(file_path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not save profile: {str(e)}")
+    
     def show_about(self):
         about = """Enhanced Notepad Pro
 Version 3.0
@@ -627,8 +4231,41 @@ A professional text editor with:
 Built with Python & Tkinter"""
         messagebox.showinfo("About", about)
 
+def report_startup_when_ready(root, interval=100):
+    # Wait for the background dictionary load so the report covers it too
+    if not engines_warm.is_set():
+        root.after(interval, report_startup_when_ready, root, interval)
+    else:
+        startup.report()
+
+
 # Main
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enhanced Notepad Pro")
+    parser.add_argument('files', nargs='*', help="files to open")
+    parser.add_argument('--new-instance', action='store_true',
+                        help="do not hand the files to a running editor, and do not take over from it")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="print where launch time goes")
+    parser.add_argument('--instrument', action='store_true',
+                        help="time event handlers; F12 shows the latency overlay")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = EnhancedNotepadPro(root)
+    startup.mark("tk.Tk()")
+    app = EnhancedNotepadPro(root, HandlerProfiler() if args.instrument else None)
+    startup.mark("EnhancedNotepadPro()")
+    if args.files:
+        root.after_idle(app.open_paths, [os.path.abspath(path) for path in args.files])
+    # Later launches hand their files to this process (see hand_off)
+    server = None
+    if hasattr(socket, 'AF_UNIX') and not args.new_instance:
+        try:
+            server = InstanceServer(root, instance_socket_path(), app.open_paths)
+        except OSError:
+            pass
+    if args.profile_startup:
+        report_startup_when_ready(root)
     root.mainloop()
+    if server:
+        server.close()
@@ -0,0 +1,648 @@
+# The parts of the editor that need no Tk: spelling, grammar and text
+# statistics, the LRUCache behind their caches, the syntax highlighting
+# lexers (RegexLexer subclasses, picked by extension from LEXERS), and the
+# SearchIndex behind Find in Files. Also a batch command line that runs the
+# analysis over many files in a process pool and streams one JSON report per
+# file.
+#
+#   python notepad_core.py docs/ "notes/**/*.md" --jobs 8 > report.jsonl
+import time
+import re
+from collections import OrderedDict
+import argparse
+import array
+import codecs
+import fnmatch
+import functools
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+# The spell checker is created on first use: loading the dictionary takes
+# seconds. Each batch worker process loads its own copy once.
+_spell = None
+_spell_lock = threading.Lock()
+_grammar = None
+
+
+def get_spell_checker():
+    global _spell
+    if _spell is None:
+        with _spell_lock:
+            if _spell is None:
+                from spellchecker import SpellChecker
+                checker = SpellChecker()
+                checker.word_frequency.load_words(['mera', 'naam', 'ahsan', 'kaise', 'ho'])
+                _spell = checker
+    return _spell
+
+
+WORD_RE = re.compile(r'\b\w+\b')
+NEWLINE_RE = re.compile(r'\n')
+SENTENCE_RE = re.compile(r'[^\s.!?][^.!?\n]*[.!?]*')
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def __contains__(self, key):
+        return key in self.data
+    
+    def __len__(self):
+        return len(self.data)
+    
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+    
+    def get(self, key, default=None):
+        try:
+            self.data.move_to_end(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self.data[key]
+    
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+
+_BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def detect_encoding(file_path, sample_size=64 * 1024):
+    with open(file_path, 'rb') as f:
+        sample = f.read(sample_size)
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    # BOM-less UTF-16 shows up as NUL bytes in every other position
+    if sample.count(b'\x00') > len(sample) // 4:
+        return 'utf-16-le' if sample[1::2].count(b'\x00') > sample[::2].count(b'\x00') else 'utf-16-be'
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # The sample may end in the middle of a multi-byte character
+        if len(sample) == sample_size and e.start >= len(sample) - 3:
+            return 'utf-8'
+    # latin-1 maps every byte, so saving writes the original bytes back
+    return 'latin-1'
+
+
+def iter_matches(pattern, text, first_line=1):
+    # Yields (line, start_col, end_col, match) in a single pass. Columns are
+    # relative to the line the match starts on, so end_col - start_col is the
+    # match length even for a match spanning lines.
+    line, line_start, pos = first_line, 0, 0
+    for match in pattern.finditer(text):
+        start = match.start()
+        newlines = text.count('\n', pos, start)
+        if newlines:
+            line += newlines
+            line_start = text.rfind('\n', pos, start) + 1
+        pos = start
+        yield line, start - line_start, match.end() - line_start, match
+
+
+def iter_words(text, first_line=1):
+    for line, start, end, match in iter_matches(WORD_RE, text, first_line):
+        yield line, start, end, match.group()
+
+
+def misspelled_words(text, checker, first_line=1):
+    # Classifies each distinct word once, then maps the verdicts back onto
+    # the word offsets. Returns ([(line, start_col, end_col, word), ...], unknown words).
+    words = list(iter_words(text, first_line))
+    unknown = checker.unknown({word for _, _, _, word in words})
+    return [item for item in words if item[3] in unknown or item[3].lower() in unknown], unknown
+
+
+def misspelled_spans(text, checker, first_line=1):
+    # Returns ([(start_index, end_index), ...], unknown words) for tagging
+    words, unknown = misspelled_words(text, checker, first_line)
+    return [(f'{line}.{start}', f'{line}.{end}') for line, start, end, _ in words], unknown
+
+
+class GrammarRule:
+    # A named check run on one sentence. Every match of pattern is an issue;
+    # fix, if given, turns the matched text into its correction.
+    def __init__(self, name, message, pattern, fix=None, flags=0):
+        self.name = name
+        self.message = message
+        self.pattern = re.compile(pattern, flags)
+        self.fix = fix
+    
+    def find(self, sentence):
+        return [match.span() for match in self.pattern.finditer(sentence)]
+
+
+class BalanceRule(GrammarRule):
+    # Flags brackets without a partner, or the last quote of an odd count
+    def __init__(self, name, message, opening, closing):
+        super().__init__(name, message, re.escape(opening) + '|' + re.escape(closing))
+        self.opening = opening
+        self.closing = closing
+    
+    def find(self, sentence):
+        positions = [match.start() for match in self.pattern.finditer(sentence)]
+        if self.opening == self.closing:
+            return [(positions[-1], positions[-1] + 1)] if len(positions) % 2 else []
+        unmatched = []
+        for pos in positions:
+            if sentence[pos] == self.closing and unmatched and sentence[unmatched[-1]] == self.opening:
+                unmatched.pop()
+            else:
+                unmatched.append(pos)
+        return [(pos, pos + 1) for pos in unmatched]
+
+
+GRAMMAR_RULES = [
+    GrammarRule('capitalization', "Start the sentence with a capital letter", r'^[a-z]', fix=str.upper),
+    GrammarRule('repeated-word', "Repeated word", r'\b(\w+)(?:\s+\1\b)+', fix=lambda text: text.split()[0],
+                flags=re.IGNORECASE),
+    GrammarRule('space-before-punctuation', "Remove the space before punctuation", r'\s+(?=[,.;:!?])',
+                fix=lambda text: ''),
+    GrammarRule('missing-space', "Add a space after punctuation", r'[,;](?=[A-Za-z])',
+                fix=lambda text: text + ' '),
+    GrammarRule('multiple-spaces', "Use a single space", r'(?<=\S) {2,}(?=\S)', fix=lambda text: ' '),
+    GrammarRule('lowercase-i', "Capitalize 'I'", r"\bi\b(?!\.)", fix=str.upper),
+    BalanceRule('unbalanced-brackets', "Unbalanced bracket", '(', ')'),
+    BalanceRule('unbalanced-quotes', "Unbalanced quote", '"', '"'),
+]
+
+
+class GrammarChecker:
+    # Runs the rules on sentences streamed line by line. Results are cached
+    # per sentence text, so re-checking after an edit only runs the rules on
+    # sentences that changed. timings holds [seconds, sentences, issues] per
+    # rule for the sentences actually checked.
+    def __init__(self, rules=GRAMMAR_RULES, cache_size=20000):
+        self.rules = {rule.name: rule for rule in rules}
+        self.cache = LRUCache(cache_size)
+        self.timings = {rule.name: [0.0, 0, 0] for rule in rules}
+    
+    def check(self, sentence):
+        # [(rule name, start, end), ...] relative to the sentence
+        issues = self.cache.get(sentence)
+        if issues is None:
+            issues = []
+            for name, rule in self.rules.items():
+                start = time.perf_counter()
+                found = rule.find(sentence)
+                timing = self.timings[name]
+                timing[0] += time.perf_counter() - start
+                timing[1] += 1
+                timing[2] += len(found)
+                issues.extend((name, a, b) for a, b in found)
+            issues = tuple(issues)
+            self.cache.put(sentence, issues)
+        return issues
+    
+    @staticmethod
+    def continues(previous):
+        # Whether a line carries on the sentence the previous line started
+        previous = previous.rstrip()
+        return bool(previous) and previous[-1] not in '.!?'
+    
+    def line_issues(self, text, line, continued=False):
+        for match in SENTENCE_RE.finditer(text):
+            offset = match.start()
+            for name, start, end in self.check(match.group()):
+                if continued and name == 'capitalization':
+                    continue
+                yield line, offset + start, offset + end, name
+            continued = False
+    
+    def issues(self, lines, first_line=1):
+        # Yields (line, start_col, end_col, rule name) for an iterable of lines
+        previous = ''
+        for line, text in enumerate(lines, first_line):
+            yield from self.line_issues(text, line, self.continues(previous))
+            previous = text
+
+
+def get_grammar_checker():
+    global _grammar
+    if _grammar is None:
+        _grammar = GrammarChecker()
+    return _grammar
+
+
+def text_stats(text):
+    # The same counts as TextStats in the editor
+    return {'words': len(WORD_RE.findall(text)), 'chars': len(text), 'lines': text.count('\n') + 1}
+
+
+CHECKS = ('stats', 'spelling', 'grammar')
+
+
+def analyze_text(text, checks=CHECKS):
+    # Columns are 0-based and lines 1-based, like Tk text indices
+    report = {}
+    if 'stats' in checks:
+        report['stats'] = text_stats(text)
+    if 'spelling' in checks:
+        words, _ = misspelled_words(text, get_spell_checker())
+        report['spelling'] = [{'line': line, 'start': start, 'end': end, 'word': word}
+                              for line, start, end, word in words]
+    if 'grammar' in checks:
+        checker = get_grammar_checker()
+        report['grammar'] = [{'line': line, 'start': start, 'end': end, 'rule': name,
+                              'message': checker.rules[name].message}
+                             for line, start, end, name in checker.issues(text.split('\n'))]
+    return report
+
+
+def analyze_file(file_path, checks=CHECKS):
+    report = {'file': file_path}
+    try:
+        encoding = detect_encoding(file_path)
+        with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+            text = f.read()
+    except OSError as e:
+        report['error'] = str(e)
+        return report
+    report['encoding'] = encoding
+    report.update(analyze_text(text, checks))
+    return report
+
+
+def expand_paths(paths, pattern='*.txt'):
+    # Files as given, directories searched recursively for pattern (several
+    # may be given as '*.txt;*.md'), and glob patterns (** included)
+    # expanded; each file is listed once.
+    patterns = pattern.split(';')
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found = sorted(os.path.join(folder, name) for folder, _, names in os.walk(path)
+                           for name in names if any(fnmatch.fnmatch(name, p) for p in patterns))
+        elif glob.has_magic(path):
+            found = sorted(name for name in glob.glob(path, recursive=True) if os.path.isfile(name))
+        else:
+            found = [path]
+        for name in found:
+            if name not in seen:
+                seen.add(name)
+                yield name
+
+
+class RegexLexer:
+    # Splits one line at a time into (start, end, token type) spans. The
+    # state passed in and returned carries what is still open at the end of
+    # a line - a triple-quoted string, a code fence - into the next one;
+    # None is the plain state. rules are (token type, pattern) tried in order.
+    rules = []
+    
+    def __init__(self):
+        self.types = [kind for kind, _ in self.rules]
+        self.pattern = re.compile('|'.join(f'(?P<t{i}>{pattern})' for i, (_, pattern) in enumerate(self.rules)))
+    
+    def lex(self, line, state=None):
+        return [(match.start(), match.end(), self.types[int(match.lastgroup[1:])])
+                for match in self.pattern.finditer(line) if match.end() > match.start()], state
+
+
+PYTHON_KEYWORDS = ('False None True and as assert async await break class continue def del elif else except '
+                   'finally for from global if import in is lambda nonlocal not or pass raise return try '
+                   'while with yield match case').split()
+
+
+class PythonLexer(RegexLexer):
+    rules = [
+        ('comment', r'#.*'),
+        ('triple', r'(?:\b[rRbBuUfF]{1,2})?(?:"""|\'\'\')'),
+        ('string', r'(?:\b[rRbBuUfF]{1,2})?(?:"(?:[^"\\]|\\.)*"?|\'(?:[^\'\\]|\\.)*\'?)'),
+        ('decorator', r'^\s*@[\w.]+'),
+        ('function', r'(?<=\bdef )\w+|(?<=\bclass )\w+'),
+        ('keyword', r'\b(?:' + '|'.join(PYTHON_KEYWORDS) + r')\b'),
+        ('number', r'\b(?:0[xXoObB][\da-fA-F_]+|\d[\d_]*(?:\.[\d_]*)?(?:[eE][+-]?\d+)?j?)\b'),
+    ]
+    
+    def lex(self, line, state=None):
+        # state is the closing delimiter of an open triple-quoted string
+        spans = []
+        pos = 0
+        if state:
+            end = line.find(state)
+            if end < 0:
+                return [(0, len(line), 'string')] if line else [], state
+            spans.append((0, end + 3, 'string'))
+            pos = end + 3
+        while True:
+            match = self.pattern.search(line, pos)
+            if match is None:
+                return spans, None
+            kind = self.types[int(match.lastgroup[1:])]
+            if kind == 'triple':
+                delimiter = match.group()[-3:]
+                end = line.find(delimiter, match.end())
+                if end < 0:
+                    spans.append((match.start(), len(line), 'string'))
+                    return spans, delimiter
+                spans.append((match.start(), end + 3, 'string'))
+                pos = end + 3
+            else:
+                if match.end() > match.start():
+                    spans.append((match.start(), match.end(), kind))
+                pos = max(match.end(), match.start() + 1)
+
+
+class JsonLexer(RegexLexer):
+    rules = [
+        ('key', r'"(?:[^"\\]|\\.)*"(?=\s*:)'),
+        ('string', r'"(?:[^"\\]|\\.)*"?'),
+        ('number', r'-?\b\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b'),
+        ('keyword', r'\b(?:true|false|null)\b'),
+    ]
+
+
+class MarkdownLexer(RegexLexer):
+    rules = [
+        ('heading', r'^#{1,6}(?:\s.*)?$'),
+        ('comment', r'^\s*>.*'),
+        ('keyword', r'^\s*(?:[-*+]|\d+[.)])(?=\s)'),
+        ('code', r'`[^`]+`'),
+        ('emphasis', r'\*\*[^*]+\*\*|__[^_]+__|\*[^*\s][^*]*\*|\b_[^_]+_\b'),
+        ('link', r'!?\[[^\]]*\]\([^)]*\)'),
+    ]
+    
+    def lex(self, line, state=None):
+        # state is the fence (``` or ~~~) of an open code block
+        stripped = line.lstrip()
+        if state:
+            return [(0, len(line), 'code')] if line else [], None if stripped.startswith(state) else state
+        if stripped.startswith('```') or stripped.startswith('~~~'):
+            return [(0, len(line), 'code')], stripped[:3]
+        return super().lex(line)
+
+
+class LogLexer(RegexLexer):
+    rules = [
+        ('timestamp', r'^\[?\d{4}-\d\d-\d\d[ T]\d\d:\d\d:\d\d(?:[.,]\d+)?(?:Z|[+-]\d\d:?\d\d)?\]?'),
+        ('error', r'\b(?:ERROR|FATAL|CRITICAL|SEVERE|Traceback)\b'),
+        ('warning', r'\bWARN(?:ING)?\b'),
+        ('info', r'\bINFO\b'),
+        ('debug', r'\b(?:DEBUG|TRACE)\b'),
+    ]
+
+
+LEXERS = {
+    '.py': PythonLexer(),
+    '.pyw': PythonLexer(),
+    '.json': JsonLexer(),
+    '.md': MarkdownLexer(),
+    '.markdown': MarkdownLexer(),
+    '.log': LogLexer(),
+}
+
+
+def lexer_for(file_path):
+    return LEXERS.get(os.path.splitext(file_path)[1].lower()) if file_path else None
+
+
+def file_postings(file_path):
+    # {token: [line, ...]} for one file; binary files have no tokens
+    postings = {}
+    with open(file_path, 'r', encoding=detect_encoding(file_path), errors='replace') as f:
+        for line, text in enumerate(f, 1):
+            if '\x00' in text:
+                return {}
+            for token in set(WORD_RE.findall(text.lower())):
+                postings.setdefault(token, []).append(line)
+    return postings
+
+
+def line_previews(file_path, lines):
+    # {line: text} for the wanted line numbers, reading only up to the last one
+    wanted = set(lines)
+    last = max(wanted, default=0)
+    previews = {}
+    try:
+        with open(file_path, 'r', encoding=detect_encoding(file_path), errors='replace') as f:
+            for line, text in enumerate(f, 1):
+                if line in wanted:
+                    previews[line] = text.rstrip('\r\n')
+                if line >= last:
+                    break
+    except OSError:
+        pass
+    return previews
+
+
+SEARCH_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER);
+CREATE TABLE IF NOT EXISTS postings (token TEXT, file INTEGER, lines BLOB, PRIMARY KEY (token, file)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_file ON postings (file);
+'''
+
+
+class SearchIndex:
+    # Persistent inverted index for Find in Files: token -> (file, line
+    # numbers) in SQLite. update() only re-reads files whose mtime or size
+    # changed since they were indexed, and may run on a worker thread while
+    # search() runs on another: each thread gets its own connection, and WAL
+    # mode lets reads proceed during a write.
+    def __init__(self, db_path, max_size=16 * 1024 * 1024, batch=200):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.batch = batch
+        self.local = threading.local()
+        self.cancelled = threading.Event()
+        self.done = 0
+        self.total = 0
+    
+    def connection(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SEARCH_SCHEMA)
+            self.local.db = db
+        return db
+    
+    def close(self):
+        db = getattr(self.local, 'db', None)
+        if db is not None:
+            db.close()
+            self.local.db = None
+    
+    def update(self, paths):
+        # Brings the index in line with paths: new and changed files are
+        # (re)indexed, files no longer listed or gone are dropped. Returns
+        # the number of files read.
+        db = self.connection()
+        known = {path: (file_id, mtime, size) for file_id, path, mtime, size
+                 in db.execute('SELECT id, path, mtime, size FROM files')}
+        paths = list(dict.fromkeys(paths))
+        self.done, self.total = 0, len(paths)
+        seen = set()
+        changed = 0
+        try:
+            for path in paths:
+                if self.cancelled.is_set():
+                    return changed
+                self.done += 1
+                try:
+                    stat = os.stat(path)
+                    entry = known.get(path)
+                    if entry and entry[1] == stat.st_mtime and entry[2] == stat.st_size:
+                        seen.add(path)
+                        continue
+                    postings = file_postings(path) if stat.st_size <= self.max_size else {}
+                except OSError:
+                    continue
+                seen.add(path)
+                if entry:
+                    file_id = entry[0]
+                    db.execute('DELETE FROM postings WHERE file = ?', (file_id,))
+                    db.execute('UPDATE files SET mtime = ?, size = ? WHERE id = ?',
+                               (stat.st_mtime, stat.st_size, file_id))
+                else:
+                    file_id = db.execute('INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)',
+                                         (path, stat.st_mtime, stat.st_size)).lastrowid
+                db.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                               ((token, file_id, array.array('I', lines).tobytes())
+                                for token, lines in postings.items()))
+                changed += 1
+                if changed % self.batch == 0:
+                    db.commit()
+            
+            for path, (file_id, _, _) in known.items():
+                if path not in seen:
+                    db.execute('DELETE FROM postings WHERE file = ?', (file_id,))
+                    db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+        finally:
+            db.commit()
+        return changed
+    
+    def term_lines(self, db, term):
+        # {file id: set of lines} for a token, or every token starting with
+        # it when the term ends in '*'
+        if term.endswith('*'):
+            prefix = term[:-1]
+            rows = db.execute('SELECT file, lines FROM postings WHERE token >= ? AND token < ?',
+                              (prefix, prefix + '\U0010ffff'))
+        else:
+            rows = db.execute('SELECT file, lines FROM postings WHERE token = ?', (term,))
+        found = {}
+        for file_id, lines in rows:
+            found.setdefault(file_id, set()).update(array.array('I', lines))
+        return found
+    
+    def search(self, query, limit=500):
+        # Files containing every word of query. Lines holding all the words
+        # are listed; if the words only meet across lines, each line with
+        # one of them is. Returns ([(path, line), ...], number of files).
+        terms = []
+        for word in query.lower().split():
+            tokens = WORD_RE.findall(word)
+            if tokens and word.endswith('*'):
+                tokens[-1] += '*'
+            terms.extend(tokens)
+        if not terms:
+            return [], 0
+        
+        db = self.connection()
+        matches = None
+        for term in dict.fromkeys(terms):
+            found = self.term_lines(db, term)
+            if matches is None:
+                matches = {file_id: [lines] for file_id, lines in found.items()}
+            else:
+                matches = {file_id: sets + [found[file_id]] for file_id, sets in matches.items()
+                           if file_id in found}
+            if not matches:
+                return [], 0
+        
+        paths = {}
+        ids = list(matches)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            paths.update(db.execute(f'SELECT id, path FROM files WHERE id IN ({",".join("?" * len(chunk))})',
+                                    chunk))
+        hits = []
+        for file_id, sets in sorted((item for item in matches.items() if item[0] in paths),
+                                    key=lambda item: paths[item[0]]):
+            lines = set.intersection(*sets) or set.union(*sets)
+            hits.extend((paths[file_id], line) for line in sorted(lines))
+            if len(hits) >= limit:
+                break
+        return hits[:limit], len(matches)
+
+
+def init_worker(checks):
+    # Load the dictionary once per process rather than once per file
+    if 'spelling' in checks:
+        get_spell_checker()
+
+
+def run_batch(paths, checks=CHECKS, jobs=None, chunksize=8):
+    # Yields reports in input order as they complete. jobs=1 stays in this
+    # process; otherwise files are spread over a pool of worker processes.
+    analyze = functools.partial(analyze_file, checks=checks)
+    if jobs == 1:
+        yield from map(analyze, paths)
+        return
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(checks,)) as pool:
+        yield from pool.map(analyze, paths, chunksize=chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spell, grammar and statistics reports for many files, "
+                                                 "written as JSON Lines")
+    parser.add_argument('paths', nargs='+', help="files, directories or glob patterns")
+    parser.add_argument('--checks', nargs='+', choices=CHECKS, default=list(CHECKS))
+    parser.add_argument('--pattern', default='*.txt', help="file name pattern used inside directories")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--chunksize', type=int, default=8, help="files handed to a worker at a time")
+    parser.add_argument('--output', '-o', help="report file (default: stdout)")
+    args = parser.parse_args(argv)
+    
+    paths = list(expand_paths(args.paths, args.pattern))
+    if not paths:
+        parser.error("no files matched")
+    
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    start = time.perf_counter()
+    files = issues = errors = 0
+    try:
+        for report in run_batch(paths, args.checks, max(1, args.jobs), max(1, args.chunksize)):
+            output.write(json.dumps(report, ensure_ascii=False) + '\n')
+            output.flush()
+            files += 1
+            errors += 'error' in report
+            issues += len(report.get('spelling', ())) + len(report.get('grammar', ()))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print(f"{files} files, {issues} issues, {errors} errors in {elapsed:.2f}s "
+          f"({files / elapsed:.1f} files/s, {args.jobs} jobs)", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
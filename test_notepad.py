@@ -0,0 +1,136 @@
+import json
+import os
+import random
+import time
+import tkinter as tk
+
+import pytest
+
+import notepad
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'config'))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("needs a display")
+    root.withdraw()
+    yield root
+    try:
+        root.destroy()
+    except tk.TclError:
+        pass
+
+
+def pump(root, done, timeout=10):
+    deadline = time.time() + timeout
+    while not done():
+        assert time.time() < deadline
+        root.update()
+        time.sleep(0.01)
+
+
+def write_json(file_path, data):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def test_piece_table_tracks_edits():
+    reference = ''.join(f'line {i}\n' for i in range(200))
+    document = notepad.PieceTable(reference)
+    rng = random.Random(1)
+    for _ in range(500):
+        offset = rng.randint(0, len(reference))
+        if rng.random() < 0.6:
+            text = rng.choice(['x', 'word ', '\n', 'two\nlines\n'])
+            document.insert(offset, text)
+            reference = reference[:offset] + text + reference[offset:]
+        else:
+            end = min(len(reference), offset + rng.randint(1, 40))
+            document.delete(offset, end)
+            reference = reference[:offset] + reference[end:]
+    
+    assert document.text() == reference and len(document) == len(reference)
+    lines = reference.split('\n')
+    assert document.line_count == len(lines)
+    assert list(document.iter_lines()) == lines
+    starts = [0]
+    for line in lines[:-1]:
+        starts.append(starts[-1] + len(line) + 1)
+    for line, start in enumerate(starts, 1):
+        assert document.line_offset(line) == start
+    for offset in range(0, len(reference) + 1, 7):
+        index = document.index(offset)
+        line, col = map(int, index.split('.'))
+        assert starts[line - 1] + col == offset
+        assert document.offset(index) == offset
+    assert document.copy().text() == reference
+
+
+def replay(base, ops):
+    document = notepad.PieceTable(base)
+    for op, start, end, text in ops:
+        document.on_change(notepad.TextChange(op, start, end, text, 0, 0, 0))
+    return document.text()
+
+
+def test_recovery_journal_rotate_commit_load(tmp_path):
+    directory = str(tmp_path / 'recovery')
+    journal = notepad.RecoveryJournal(directory, 'session')
+    journal.start(None, 'utf-8')
+    journal.record(notepad.TextChange('insert', '1.0', '1.0', 'hello world', 1, 1, 1))
+    
+    # An autosave snapshot of the buffer so far moves the base past segment 0
+    token = journal.rotate()
+    snapshot = journal.snapshot_path(token[1])
+    notepad.atomic_write(snapshot, 'hello world')
+    journal.commit(token, snapshot)
+    journal.record(notepad.TextChange('delete', '1.5', '1.11', '', 1, 1, 1))
+    journal.record(notepad.TextChange('insert', '1.5', '1.5', ',\nagain', 1, 1, 2))
+    journal.flush()
+    assert not os.path.exists(journal.path('0.journal'))
+    
+    # Reading the chain back, as after a crash
+    with open(journal.path('state.json'), encoding='utf-8') as f:
+        state = json.load(f)
+    base, ops = notepad.RecoveryJournal.load(directory, 'session', state)
+    assert base == 'hello world' and len(ops) == 2
+    assert replay(base, ops) == 'hello,\nagain'
+    
+    # A commit from an older chain is ignored
+    journal.start(None, 'utf-8')
+    journal.commit(token, snapshot)
+    with open(journal.path('state.json'), encoding='utf-8') as f:
+        assert json.load(f)['base_seq'] == 0
+    journal.stop()
+    assert os.listdir(directory) == []
+
+
+def test_file_state_survives_lazy_tabs(root, tmp_path):
+    # Last session left two files open; only the active one is read on start
+    shown, hidden = str(tmp_path / 'shown.txt'), str(tmp_path / 'hidden.txt')
+    for file_path in (shown, hidden):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(f'line {i}\n' for i in range(500)))
+    write_json(os.path.join(notepad.user_config_dir(), 'settings.json'),
+               {'open_files': [shown, hidden], 'active_tab': 0})
+    state_file = os.path.join(notepad.user_data_dir(), 'file_state.json')
+    write_json(state_file, {shown: {'cursor': '120.3', 'yview': 0.2},
+                            hidden: {'cursor': '7.0', 'yview': 0.0}})
+    
+    app = notepad.EnhancedNotepadPro(root)
+    tab, lazy = app.tabs
+    pump(root, lambda: tab.loaded)
+    assert tab.text.index(tk.INSERT) == '120.3'
+    assert lazy.text is None and not lazy.loaded
+    
+    app.shutdown()
+    with open(state_file, encoding='utf-8') as f:
+        states = json.load(f)
+    assert states[shown]['cursor'] == '120.3'
+    assert states[shown]['preview'].startswith('line 0\n')
+    assert states[hidden] == {'cursor': '7.0', 'yview': 0.0}
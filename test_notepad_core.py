@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+import notepad_core
+from notepad_core import GrammarChecker, SearchIndex
+
+
+def write(file_path, text):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_search_index_update_remove_prefix(tmp_path):
+    alpha, beta = str(tmp_path / 'alpha.txt'), str(tmp_path / 'beta.txt')
+    write(alpha, "the quick fox\njumps over\nthe lazy dog\n")
+    write(beta, "quicksand and quiet\nno foxes here\n")
+    index = SearchIndex(str(tmp_path / 'index.sqlite3'))
+    try:
+        assert index.update([alpha, beta]) == 2
+        assert index.search('fox') == ([(alpha, 1)], 1)
+        assert index.search('quick*') == ([(alpha, 1), (beta, 1)], 2)
+        # Words on different lines list each line holding one of them
+        assert index.search('quick dog') == ([(alpha, 1), (alpha, 3)], 1)
+        assert index.search('nothing') == ([], 0)
+        
+        # Unchanged files are not read again
+        assert index.update([alpha, beta]) == 0
+        
+        write(alpha, "a slow fox\n")
+        os.utime(alpha, (1, 1))
+        assert index.update([alpha, beta]) == 1
+        assert index.search('quick') == ([], 0)
+        assert index.search('slow') == ([(alpha, 1)], 1)
+        
+        # Files no longer listed drop out of the index
+        index.update([beta])
+        assert index.search('fox*') == ([(beta, 2)], 1)
+    finally:
+        index.close()
+
+
+@pytest.mark.parametrize('sentence, rule, span', [
+    ("the cat sat.", 'capitalization', (0, 1)),
+    ("It was the the best.", 'repeated-word', (7, 14)),
+    ("Wait , what?", 'space-before-punctuation', (4, 5)),
+    ("Yes,no.", 'missing-space', (3, 4)),
+    ("Too  many spaces.", 'multiple-spaces', (3, 5)),
+    ("Then i left.", 'lowercase-i', (5, 6)),
+    ("An (open bracket.", 'unbalanced-brackets', (3, 4)),
+    ("A close) bracket.", 'unbalanced-brackets', (7, 8)),
+    ('He said "hi.', 'unbalanced-quotes', (8, 9)),
+])
+def test_grammar_rule_fires(sentence, rule, span):
+    issues = GrammarChecker().check(sentence)
+    assert (rule,) + span in issues
+
+
+def test_grammar_clean_sentence():
+    assert GrammarChecker().check('I said "hi" (twice), then left.') == ()
+
+
+def test_grammar_fixes():
+    rules = {rule.name: rule for rule in notepad_core.GRAMMAR_RULES}
+    assert rules['repeated-word'].fix("the the") == "the"
+    assert rules['lowercase-i'].fix("i") == "I"
+    assert rules['missing-space'].fix(",") == ", "
+
+
+def test_grammar_issues_follow_sentences_across_lines():
+    checker = GrammarChecker()
+    lines = ["This sentence goes on", "over two lines. then a new one."]
+    assert list(checker.issues(lines)) == [(2, 16, 17, 'capitalization')]
+    # Cached sentences give the same issues
+    assert list(checker.issues(lines)) == [(2, 16, 17, 'capitalization')]
+    assert checker.cache.hits > 0